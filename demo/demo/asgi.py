@@ -0,0 +1,18 @@
+"""
+ASGI config for demo project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/stable/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'demo.settings')
+#Serve the analysis pages with the async views, they wait on the bounded executor without holding a thread
+os.environ.setdefault('FINANCE_ASYNC_VIEWS', '1')
+
+application = get_asgi_application()
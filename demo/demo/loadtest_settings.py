@@ -0,0 +1,29 @@
+"""
+Settings of manage.py load_test: the project settings on a throwaway SQLite file, without debug tooling
+
+    python manage.py load_test --settings=demo.loadtest_settings
+"""
+import os
+import tempfile
+#The project settings read these from the environment, none of them matters against a local SQLite file
+for name in ['DJANGO_ALLOWED_HOST1', 'DJANGO_ALLOWED_HOST2', 'DB_PASSWORD', 'DB_HOST_ADDRESS']:
+    os.environ.setdefault(name, '')
+os.environ.setdefault('DJIANG_SECRET_KEY', 'load-test-only')
+
+from demo.settings import *
+
+#Marks these settings as safe for manage.py load_test to delete and reseed the database
+FINANCE_LOAD_TEST = True
+
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
+MIDDLEWARE = [m for m in MIDDLEWARE if not m.startswith('debug_toolbar')]
+
+#Deleted and recreated by every run. The timeout lets concurrent logins wait for the write lock instead of failing
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('FINANCE_LOAD_TEST_DB', os.path.join(tempfile.gettempdir(), 'finance_load_test.sqlite3')),
+        'OPTIONS': {'timeout': 30},
+    }
+}
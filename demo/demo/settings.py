@@ -38,11 +38,12 @@ INSTALLED_APPS = [
     'bootstrap4',
     'bbc_clone',
     'accounts',
-    'finance',
+    'finance.apps.FinanceConfig',
     'debug_toolbar',
 ]
 
 MIDDLEWARE = [
+    'finance.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -99,6 +100,24 @@ else:
     }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# The local-memory backend culls least recently used entries past MAX_ENTRIES and expires them after TIMEOUT seconds
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'finance': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'finance',
+        'TIMEOUT': 60*60,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+FINANCE_CACHE_ALIAS='finance'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -143,4 +162,72 @@ STATICFILES_DIRS= [
 LOGIN_REDIRECT_URL='/'
 LOGOUT_REDIRECT_URL='/'
 
-INTERNAL_IPS=['127.0.0.1']
\ No newline at end of file
+INTERNAL_IPS=['127.0.0.1']
+
+# Finance app
+
+#Unpickle the FWB prediction models when the app loads instead of on the first prediction request
+FINANCE_PRELOAD_MODELS=False
+#Import numpy/scipy and run each analysis once when the app loads. Off by default so workers that
+#never serve an analysis page stay light, see manage.py startup_profile
+FINANCE_WARM_UP=False
+
+#Run simulations in a background process pool and let the page poll for the result
+FINANCE_ASYNC_SIMULATION=True
+FINANCE_JOB_WORKERS=2
+#Seconds after which a job still pending is taken as lost, failed and resubmitted on the next request
+FINANCE_JOB_TIMEOUT=300
+
+#Monte Carlo trials per simulation. Setting a worker count shards the trials across that many processes
+#with per-shard seeds, so results do not depend on the worker count (e.g. 16 on the 16-core boxes).
+#The trials are split into shards of FINANCE_SIM_SHARD_SIZE, so keep trials/shard size at or above the worker count.
+#Sharded runs ignore FINANCE_SIM_ADAPTIVE, and the scenario bank runs in-process ignoring the worker count
+FINANCE_SIM_TRIALS=5000
+FINANCE_SIM_WORKERS=None
+FINANCE_SIM_SHARD_SIZE=250
+
+#Run the single-process simulation in batches and stop once more trials cannot change the diagnosis,
+#FINANCE_SIM_TRIALS is then the cap
+FINANCE_SIM_ADAPTIVE=True
+FINANCE_SIM_BATCH_SIZE=500
+
+#Simulate a stocks/bonds/cash portfolio along a glide path instead of a single asset: 'normal', 't' for fat tailed
+#returns or 'bootstrap' to resample the yearly returns (years x assets .npy) at FINANCE_SIM_PORTFOLIO_HISTORY.
+#Portfolio runs take precedence over the scenario bank and run in-process. None keeps the single asset model
+FINANCE_SIM_PORTFOLIO=None
+FINANCE_SIM_PORTFOLIO_HISTORY=None
+
+#'json' serves the simulation chart as a cacheable JSON series drawn in the browser,
+#'bokeh' renders the figure on the server (through the background jobs above when enabled)
+FINANCE_CHART_MODE='json'
+
+#Show a rough moment matched estimate of the median wealth path first, without a diagnosis.
+#The page links to the full Monte Carlo run
+FINANCE_SIM_PREVIEW=True
+
+#Threads running the three analyses of a dashboard request side by side
+FINANCE_DASHBOARD_THREADS=3
+
+#Async analysis views, enabled by demo/asgi.py
+FINANCE_ASYNC_VIEWS=os.environ.get('FINANCE_ASYNC_VIEWS')=='1'
+#Threads running their numerical work, and how many calls may wait for one before answering 503
+FINANCE_ASYNC_WORKERS=4
+FINANCE_ASYNC_QUEUE=8
+#Seconds sent in the Retry-After header of those 503 responses
+FINANCE_RETRY_AFTER=5
+
+#Pre-generated return shocks shared by every worker through a read-only memory map, built by
+#manage.py build_scenario_bank. While the file exists simulations scale it instead of drawing random numbers
+FINANCE_SCENARIO_BANK=os.path.join(BASE_DIR, 'finance_scenarios.npy')
+
+#What-if sweeps: trials shared by every cell, most values per swept field and most cells per request
+FINANCE_SWEEP_TRIALS=2000
+FINANCE_SWEEP_MAX_VALUES=50
+FINANCE_SWEEP_MAX_CELLS=500
+
+#Stage timers, request timing middleware and the /metrics endpoint, aggregated per process
+FINANCE_METRICS=False
+
+#FWB model predictions for every combination of survey answers, built by manage.py build_prediction_table
+#or on first use, and rebuilt whenever the model files change
+FINANCE_PREDICTION_TABLE=os.path.join(BASE_DIR, 'finance_prediction_table.npz')
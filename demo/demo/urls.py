@@ -16,6 +16,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, re_path, include
 from demo import views, settings
+from finance.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -23,6 +24,7 @@ urlpatterns = [
     re_path('^$', views.HomeTemplateView.as_view(), name='home'),
     path('accounts/', include('accounts.urls', namespace='accounts')),
     path('finance/', include('finance.urls', namespace='finance')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class FinanceConfig(AppConfig):
     name = 'finance'
+
+    def ready(self):
+        from finance import metrics
+        metrics.enabled=getattr(settings, 'FINANCE_METRICS', False)
+        #Optionally pay the import and first-call cost at startup instead of on the first analysis request
+        if getattr(settings, 'FINANCE_WARM_UP', False):
+            from finance.startup import warm_up
+            warm_up()
+        #Optionally pay the model unpickling cost at startup instead of on the first prediction request
+        if getattr(settings, 'FINANCE_PRELOAD_MODELS', False):
+            from finance.prediction import registry
+            registry.load()
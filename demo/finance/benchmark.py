@@ -0,0 +1,151 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+import numpy as np
+from finance import health_check, preview
+from finance.cache import ENGINE_VERSION
+
+#Default sweep: planning horizons in years, simulation trial counts and investment risk levels
+HORIZONS=[10, 25, 50, 75, 100]
+TRIALS=[1000, 5000, 20000]
+RISKS=[1, 5, 9]
+
+def profile(user, retirement_offset=0.6):
+    """
+    Synthetic user financial information for a planning horizon, retiring after the given share of it
+    """
+    current_age=20
+    death_age=current_age+user['horizon']
+    return {'userIncome':60000, 'incomeGrowth':0.02, 'userSpending':45000, 'inflation':0.02, 'userSavings':20000,
+            'userCurrentAge':current_age, 'userDeathAge':death_age,
+            'userRetirementAge':current_age+int(user['horizon']*retirement_offset)}
+
+def arguments(user, risk):
+    """
+    Output: Positional health check arguments of a synthetic user at the given risk level
+    """
+    return (user['userIncome'], user['incomeGrowth'], user['userSpending'], user['inflation'], user['userSavings'],
+            risk, user['userCurrentAge'], user['userDeathAge'], user['userRetirementAge'])
+
+def measure(fn, repeat):
+    """
+    Runs fn repeat times for latency, then once more under tracemalloc for memory
+    Output: Dictionary of latency (seconds), peak traced memory (bytes) and newly allocated blocks
+    """
+    fn()#Warm up imports and caches
+    timings=[]
+    for _ in range(repeat):
+        start=time.perf_counter()
+        fn()
+        timings.append(time.perf_counter()-start)
+    tracemalloc.start()
+    before=tracemalloc.take_snapshot()
+    fn()
+    _, peak=tracemalloc.get_traced_memory()
+    after=tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated=sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    return {'min_s':min(timings), 'median_s':statistics.median(timings), 'max_s':max(timings),
+            'peak_memory_bytes':peak, 'allocated_blocks':allocated}
+
+def cases(horizons=HORIZONS, trials=TRIALS, risks=RISKS, prediction=True):
+    """
+    Output: List of (name, parameters, zero-argument function) benchmark cases over the sweep
+    """
+    result=[]
+    for horizon in horizons:
+        user=profile({'horizon':horizon})
+        result.append(('reqReturnHealthCheck', {'horizon':horizon}, lambda user=user: health_check.reqReturnHealthCheck(**user)))
+        for n in trials:
+            for risk in risks:
+                params={'horizon':horizon, 'trials':n, 'risk':risk}
+                result.append(('simHealthCheck', params,
+                    lambda user=user, n=n, risk=risk: health_check.simHealthCheck(investmentRisk=risk, trials=n, seed=0, **user)))
+            lifetimeIncome=health_check.yearlyTotalIncome(user['userIncome'], user['incomeGrowth'], user['userCurrentAge'], user['userDeathAge'], user['userRetirementAge'])
+            lifetimeSpending=health_check.yearlyTotalSpending(user['userSpending'], user['inflation'], user['userCurrentAge'], user['userDeathAge'])
+            summary=health_check.simSummary(lifetimeIncome, lifetimeSpending, user['userSavings'], 5, n, np.random.default_rng(0))
+            result.append(('simGraph', {'horizon':horizon, 'trials':n}, lambda summary=summary: health_check.simGraph(summary)))
+        for risk in risks:
+            result.append(('previewSeries', {'horizon':horizon, 'risk':risk},
+                lambda user=user, risk=risk: preview.previewSeries(*arguments(user, risk))))
+    if prediction:
+        from finance.prediction import encoding_order, make_prediction
+        answers={'FWB1_3':'Somewhat', 'FWB1_5':'Somewhat', 'FWB1_6':'Very little', 'FWB2_1':'Rarely', 'FWB2_3':'Never'}
+        result.append(('make_prediction', {}, lambda: make_prediction(answers, encoding_order)))
+    return result
+
+def preview_accuracy(horizons=HORIZONS, risks=RISKS, trials=20000, log=None):
+    """
+    Error of the analytic preview against a seeded Monte Carlo run of the same user, at the last year.
+    Percentile errors are relative to the Monte Carlo median, so they stay meaningful when the 5th percentile is near zero
+    Output: List of dictionaries of the ruin probability error (percentage points) and 5th/50th percentile errors
+    """
+    results=[]
+    for horizon in horizons:
+        user=profile({'horizon':horizon})
+        for risk in risks:
+            args=arguments(user, risk)
+            summary, _=health_check.simHealthSummary(*args, trials=trials, seed=0)
+            approx=preview.previewSummary(*args)
+            scale=max(abs(summary.percentile(50)[-1]), 1.0)
+            entry={'params':{'horizon':horizon, 'risk':risk, 'trials':trials},
+                   'ruin_error_pp':approx['ruin_probability']-summary.ruinProbability(),
+                   'p5_error':(approx['worst_case'][-1]-summary.percentile(5)[-1])/scale,
+                   'p50_error':(approx['average_case'][-1]-summary.percentile(50)[-1])/scale}
+            results.append(entry)
+            if log:
+                log(format_accuracy(entry))
+    return results
+
+def format_accuracy(entry):
+    params=' '.join('%s=%s' % item for item in sorted(entry['params'].items()))
+    return '%-22s %-32s ruin %+7.2f pp  p5 %+7.1f%%  p50 %+7.1f%%' % (
+        'preview accuracy', params, entry['ruin_error_pp'], entry['p5_error']*100, entry['p50_error']*100)
+
+def run(repeat=5, log=None, accuracy=True, **sweep):
+    """
+    Runs every benchmark case
+    Output: JSON serializable dictionary of environment metadata and results
+    """
+    results=[]
+    for name, params, fn in cases(**sweep):
+        try:
+            entry=dict(measure(fn, repeat), name=name, params=params)
+        except Exception as e:
+            entry={'name':name, 'params':params, 'error':repr(e)}
+        results.append(entry)
+        if log:
+            log(format_entry(entry))
+    report={'created':time.strftime('%Y-%m-%dT%H:%M:%S'), 'engine_version':ENGINE_VERSION, 'python':platform.python_version(),
+            'numpy':np.__version__, 'machine':platform.machine(), 'repeat':repeat, 'results':results}
+    if accuracy:
+        report['preview_accuracy']=preview_accuracy(sweep.get('horizons', HORIZONS), sweep.get('risks', RISKS), log=log)
+    return report
+
+def format_entry(entry):
+    params=' '.join('%s=%s' % item for item in sorted(entry['params'].items()))
+    if 'error' in entry:
+        return '%-22s %-32s error: %s' % (entry['name'], params, entry['error'])
+    return '%-22s %-32s median %9.2f ms  peak %8.1f KiB  %7d blocks' % (
+        entry['name'], params, entry['median_s']*1000, entry['peak_memory_bytes']/1024, entry['allocated_blocks'])
+
+def entry_key(entry):
+    return (entry['name'], json.dumps(entry['params'], sort_keys=True))
+
+def compare(baseline, current, tolerance=0.2):
+    """
+    Finds cases whose median latency or peak memory grew by more than tolerance since the baseline run
+    Output: List of regression description strings
+    """
+    previous={entry_key(e):e for e in baseline['results'] if 'error' not in e}
+    regressions=[]
+    for entry in current['results']:
+        old=previous.get(entry_key(entry))
+        if old is None or 'error' in entry:
+            continue
+        for metric in ('median_s', 'peak_memory_bytes'):
+            if entry[metric] > old[metric]*(1+tolerance):
+                regressions.append('%s %s: %s %.4g -> %.4g' % (entry['name'], entry['params'], metric, old[metric], entry[metric]))
+    return regressions
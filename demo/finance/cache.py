@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+from django.conf import settings
+from django.core.cache import caches
+from finance.pipeline import KIND_STAGES, kind_stage, stage_fields
+
+#Bump whenever an engine change alters results so stale entries are never served
+ENGINE_VERSION='3'
+
+#Model fields read by each cached analysis, declared by the pipeline stages
+REQ_RETURN_FIELDS=stage_fields('req_return')
+SIMULATION_FIELDS=stage_fields('simulation')
+PREDICTION_FIELDS=stage_fields('prediction')
+
+def get_cache():
+    return caches[getattr(settings, 'FINANCE_CACHE_ALIAS', 'default')]
+
+def index_key(financial_info):
+    return 'finance:index:%s' % financial_info.pk
+
+def simulation_engine():
+    """
+    Output: List of the settings and files that change simulation results without changing the inputs
+    """
+    bank=getattr(settings, 'FINANCE_SCENARIO_BANK', None)
+    bank_digest=None
+    if bank and os.path.exists(bank):
+        from finance import scenarios
+        bank_digest=scenarios.openBankDigest(bank)
+    adaptive=getattr(settings, 'FINANCE_SIM_ADAPTIVE', False)
+    sharded=getattr(settings, 'FINANCE_SIM_WORKERS', None) is not None
+    portfolio=getattr(settings, 'FINANCE_SIM_PORTFOLIO', None)
+    return [getattr(settings, 'FINANCE_SIM_TRIALS', 5000), sharded, getattr(settings, 'FINANCE_SIM_SHARD_SIZE', 2500) if sharded else None,
+            adaptive, getattr(settings, 'FINANCE_SIM_BATCH_SIZE', 500) if adaptive else None,
+            getattr(settings, 'FINANCE_SWEEP_TRIALS', 2000), bank_digest, portfolio,
+            getattr(settings, 'FINANCE_SIM_PORTFOLIO_HISTORY', None) if portfolio=='bootstrap' else None]
+
+def input_digest(kind, financial_info, fields):
+    """
+    Stable hash of the engine version and the model fields an analysis reads, plus the simulation
+    settings and scenario bank for the analyses of the simulation stage
+    Input:
+        kind (String): Analysis name
+        financial_info (FinancialInfo): User financial information row
+        fields (List): Model field names the analysis depends on
+    Output: Hex digest string
+    """
+    values=[getattr(financial_info, f) for f in fields]
+    #Pipeline stages such as return_draws hash their fields only
+    engine=simulation_engine() if KIND_STAGES.get(kind.split(':')[0])=='simulation' else None
+    return hashlib.sha1(json.dumps([ENGINE_VERSION, kind, fields, values, engine]).encode()).hexdigest()
+
+def cache_key(kind, financial_info, fields):
+    """
+    Output: Cache key of an analysis result for a financial information row
+    """
+    return 'finance:%s:%s:%s' % (kind, financial_info.pk, input_digest(kind, financial_info, fields))
+
+def get(kind, financial_info, fields):
+    """
+    Output: Cached analysis result, or None on a miss
+    """
+    return get_cache().get(cache_key(kind, financial_info, fields))
+
+def store(kind, financial_info, fields, result):
+    """
+    Stores an analysis result and records its key and stage under the row so a save can drop them
+    """
+    cache=get_cache()
+    key=cache_key(kind, financial_info, fields)
+    cache.set(key, result)
+    keys=cache.get(index_key(financial_info), {})
+    if key not in keys:
+        keys[key]=kind_stage(kind)
+        cache.set(index_key(financial_info), keys)
+
+def get_or_compute(kind, financial_info, fields, compute):
+    """
+    Returns the cached analysis result, running compute() and storing its result on a miss
+    Input:
+        kind (String): Analysis name
+        financial_info (FinancialInfo): User financial information row
+        fields (List): Model field names the analysis depends on
+        compute (Callable): Zero-argument function producing the result
+    Output: Analysis result
+    """
+    result=get(kind, financial_info, fields)
+    if result is None:
+        result=compute()
+        store(kind, financial_info, fields, result)
+    return result
+
+def invalidate(financial_info, stages=None):
+    """
+    Drops cached analysis results of a financial information row
+    Input:
+        financial_info (FinancialInfo): User financial information row
+        stages (Set): Pipeline stages to drop, see pipeline.affected_stages. None drops every result
+    """
+    cache=get_cache()
+    keys=cache.get(index_key(financial_info), {})
+    if stages is None:
+        cache.delete_many(list(keys)+[index_key(financial_info)])
+        return
+    dropped=[key for key, stage in keys.items() if stage in stages]
+    if dropped:
+        cache.delete_many(dropped)
+        cache.set(index_key(financial_info), {key:stage for key, stage in keys.items() if stage not in stages})
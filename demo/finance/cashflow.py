@@ -0,0 +1,64 @@
+from functools import lru_cache
+import numpy as np
+
+def growthFactors(rate, years):
+    """
+    Compounded growth factors (1+rate)**t for t = 0..years-1, built with a cumulative product
+    """
+    factors = np.full(years, 1+rate, dtype=np.float64)
+    if years:
+        factors[0] = 1
+    return np.cumprod(factors, out=factors)
+
+def addLumpSums(schedule, lumpSums, userCurrentAge):
+    """
+    Adds one-off amounts given as (age, amount) pairs to a yearly schedule, ignoring ages outside of it
+    """
+    for age, amount in lumpSums:
+        if 0 <= age-userCurrentAge < len(schedule):
+            schedule[age-userCurrentAge] += amount
+    return schedule
+
+@lru_cache(maxsize=4096)
+def incomeSchedule(userIncome, incomeGrowth, userCurrentAge, userDeathAge, userRetirementAge, pension=0, pensionGrowth=0, lumpSums=()):
+    """
+    Extrapolate user income to future years until death age, memoized by its parameters
+    Input: 
+        userIncome (Int): Current income level
+        incomeGrowth (Float): Decimal figure that indicates the income growth rate every year
+        userCurrentAge (Int): User current age
+        userDeathAge (Int): User expected mortality age, used to calculate life expectancy
+        userRetirementAge (Int): User retirement age, income stops after it
+        pension (Int): Yearly pension paid after retirement, 0 for none
+        pensionGrowth (Float): Yearly growth rate of the pension
+        lumpSums (Tuple): One-off (age, amount) income events such as an inheritance
+    Output: Read-only array of yearly income until death age
+    """
+    years = userDeathAge-userCurrentAge
+    schedule = userIncome*growthFactors(incomeGrowth, years)
+    retired = np.arange(userCurrentAge, userDeathAge) > userRetirementAge
+    schedule[retired] = pension*growthFactors(pensionGrowth, int(np.count_nonzero(retired)))
+    addLumpSums(schedule, lumpSums, userCurrentAge)
+    schedule.setflags(write=False)#Shared between callers through the memo
+    return schedule
+
+@lru_cache(maxsize=4096)
+def spendingSchedule(userSpending, inflation, userCurrentAge, userDeathAge, userRetirementAge=None, retirementSpendingRatio=1, lumpSums=()):
+    """
+    Extrapolate user spending to future years until death age, memoized by its parameters
+    Input: 
+        userSpending (Int): Current spending level
+        inflation (Float): Decimal figure that indicates the spending growth rate every year
+        userCurrentAge (Int): User current age
+        userDeathAge (Int): User expected mortality age, used to calculate life expectancy
+        userRetirementAge (Int): User retirement age, only needed for a step change in spending
+        retirementSpendingRatio (Float): Share of the inflated spending kept after retirement
+        lumpSums (Tuple): One-off (age, amount) spending events such as a house purchase
+    Output: Read-only array of yearly spending until death age
+    """
+    schedule = userSpending*growthFactors(inflation, userDeathAge-userCurrentAge)
+    if userRetirementAge is not None and retirementSpendingRatio != 1:
+        schedule[np.arange(userCurrentAge, userDeathAge) > userRetirementAge] *= retirementSpendingRatio
+    addLumpSums(schedule, lumpSums, userCurrentAge)
+    schedule.setflags(write=False)
+    return schedule
@@ -0,0 +1,71 @@
+import numpy as np
+from finance.cashflow import incomeSchedule, spendingSchedule
+from finance.health_check import riskReturnProfile
+from finance.solver import solveReqReturns
+
+#FinancialInfo fields packed for each user, in the order of the columns of packCohort
+cohortFields = ['income', 'income_growth', 'spending', 'inflation', 'savings', 'current_age', 'death_age', 'retirement_age', 'investment_risk']
+
+def packCohort(rows):
+    """
+    Packs many users into arrays padded to the longest horizon, with the memoized schedules of finance.cashflow
+    Input:
+        rows (List): Per-user tuples of the cohortFields values
+    Output: Dictionary with the yearly net cash flows shaped (users, maxYears), the horizon mask of the same
+        shape (True while the user is alive), savings, expected return and risk per user
+    """
+    data = np.asarray(rows, dtype=np.float64).reshape(-1, len(cohortFields))
+    income, incomeGrowth, spending, inflation, savings, currentAge, deathAge, retirementAge, risk = data.T
+    years = (deathAge-currentAge).astype(np.intp)
+    t = np.arange(years.max() if len(years) else 0)
+    mask = t < years[:, None]
+    netCashFlow = np.zeros(mask.shape)
+    for i in range(len(data)):
+        ages = (int(currentAge[i]), int(deathAge[i]))
+        netCashFlow[i, :years[i]] = incomeSchedule(income[i], incomeGrowth[i], *ages, int(retirementAge[i])) - spendingSchedule(spending[i], inflation[i], *ages)
+    profiles = np.array([riskReturnProfile(r) for r in risk]).reshape(-1, 2)
+    return {'netCashFlow':netCashFlow, 'mask':mask, 'savings':savings, 'assetReturn':profiles[:, 0], 'assetRisk':profiles[:, 1]}
+
+def cohortTerminalWealth(cohort, shocks):
+    """
+    Monte Carlo pass for a whole cohort: one (users, trials) savings array advanced year by year. Users whose
+    horizon has ended are frozen by the mask. Every user reads the same shocks (common random numbers)
+    Input:
+        cohort (Dictionary): Output of packCohort
+        shocks (Array): Standardized return shocks shaped (years, trials), with at least maxYears rows
+    Output: Array of terminal savings shaped (users, trials)
+    """
+    netCashFlow, mask = cohort['netCashFlow'], cohort['mask']
+    users, years = netCashFlow.shape
+    trials = shocks.shape[1]
+    assetReturn = cohort['assetReturn'][:, None]
+    assetRisk = cohort['assetRisk'][:, None]
+    savings = np.repeat(cohort['savings'][:, None], trials, axis=1)
+    growth = np.empty((users, trials))
+    invested = np.empty((users, trials), dtype=bool)
+    for j in range(years):
+        np.multiply(assetRisk, shocks[j], out=growth)
+        growth += assetReturn+1
+        np.greater_equal(savings, 0, out=invested)
+        invested &= mask[:, j, None]
+        np.multiply(savings, growth, out=savings, where=invested)
+        savings += netCashFlow[:, j, None]
+    return savings
+
+def cohortHealthCheck(rows, shocks):
+    """
+    Required return and Monte Carlo health check of a chunk of users in one vectorized pass
+    Input:
+        rows (List): Per-user tuples of the cohortFields values
+        shocks (Array): Standardized return shocks shaped (years, trials)
+    Output: Dictionary of per-user arrays: required return, ruin probability (%) ranked like
+        QuantileSketch.ruinProbability, and 5th percentile terminal wealth
+    """
+    cohort = packCohort(rows)
+    #Padded years carry no cash flow, which leaves the sign of terminal wealth and so the solve unchanged
+    reqReturns = solveReqReturns(cohort['netCashFlow'], cohort['savings'])
+    terminal = cohortTerminalWealth(cohort, shocks)
+    below = np.count_nonzero(terminal < 0, axis=1)
+    atOrBelow = np.count_nonzero(terminal <= 0, axis=1)
+    ruin = (below + atOrBelow + (below < atOrBelow)) * (50.0/terminal.shape[1])
+    return {'req_return':reqReturns, 'ruin_probability':ruin, 'worst_case':np.percentile(terminal, 5, axis=1)}
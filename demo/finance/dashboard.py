@@ -0,0 +1,81 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from finance import cache as finance_cache
+from finance import jobs
+
+logger=logging.getLogger(__name__)
+
+#Dashboard sections in page order, with their headings
+SECTIONS=[('req_return', 'Required Return'), ('simulation', 'Simulation'), ('prediction', 'Financial Wellbeing')]
+
+_pool=None
+_pool_lock=threading.Lock()
+
+def get_pool():
+    """
+    Output: Thread pool shared by every dashboard request of this worker, created on first use
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool=ThreadPoolExecutor(max_workers=getattr(settings, 'FINANCE_DASHBOARD_THREADS', 3), thread_name_prefix='finance-dashboard')
+    return _pool
+
+def req_return_section(q):
+    from finance import health_check
+    diagnosis=finance_cache.get_or_compute('req_return', q, finance_cache.REQ_RETURN_FIELDS,
+        lambda: health_check.reqReturnHealthCheck(q.income, q.income_growth, q.spending, q.inflation, q.savings, q.current_age, q.death_age, q.retirement_age))
+    return {'diagnosis':diagnosis}
+
+def simulation_section(q):
+    from finance import health_check
+    diagnosis, script, div=finance_cache.get_or_compute('simulation', q, finance_cache.SIMULATION_FIELDS,
+        lambda: health_check.simHealthCheck(*jobs.simulation_arguments(q), **jobs.simulation_options(q)))
+    return {'diagnosis':diagnosis, 'script':script, 'div':div}
+
+def prediction_section(q):
+    from finance.lookup import table
+    from finance.prediction import encoding_order
+    #Precomputed for every combination of answers, rebuilt by the table itself when the model files change
+    selection_dict={p:getattr(q,p) for p in encoding_order}
+    return {'diagnosis':table.predict(selection_dict)}
+
+section_functions={'req_return':req_return_section, 'simulation':simulation_section, 'prediction':prediction_section}
+
+def build_shared_inputs(q):
+    """
+    Builds the income and spending schedules once before the analyses start, the solver and the simulation
+    then read the same read-only arrays from the cash-flow memo instead of racing to build them
+    Input:
+        q (FinancialInfo): User financial information row
+    """
+    from finance import health_check
+    health_check.yearlyTotalIncome(q.income, q.income_growth, q.current_age, q.death_age, q.retirement_age)
+    health_check.yearlyTotalSpending(q.spending, q.inflation, q.current_age, q.death_age)
+
+def run_sections(q):
+    """
+    Runs the dashboard analyses concurrently in the thread pool, numpy and the predictor release the GIL
+    for most of their work. The row is fully loaded beforehand so no thread touches the database
+    Input:
+        q (FinancialInfo): User financial information row, with every analysis field loaded
+    Output: Generator of (name, heading, context) in completion order, context has an 'error' key if the analysis failed
+    """
+    build_shared_inputs(q)
+    futures={get_pool().submit(run_section, name, q):name for name, _ in SECTIONS}
+    for future in as_completed(futures):
+        yield future.result()
+
+def run_section(name, q):
+    """
+    Runs one dashboard analysis, a failure is logged and shown in its section instead of breaking the page
+    Output: Tuple of (name, heading, context), context has an 'error' key if the analysis failed
+    """
+    try:
+        context=section_functions[name](q)
+    except Exception:
+        logger.exception('Dashboard %s analysis failed for financial info %s', name, q.pk)
+        context={'error':'This analysis could not be completed, please try again.'}
+    return name, dict(SECTIONS)[name], context
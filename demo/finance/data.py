@@ -0,0 +1,46 @@
+from finance import metrics
+from finance.cache import REQ_RETURN_FIELDS, SIMULATION_FIELDS
+from finance.models import FinancialInfo
+from finance.prediction import encoding_order
+
+#Model fields read by each analysis, only these columns are fetched
+ANALYSIS_FIELDS={
+    'req_return':REQ_RETURN_FIELDS,
+    'simulation':SIMULATION_FIELDS,
+    'prediction':encoding_order,
+}
+#Always loaded: the primary key for cache keys and the user columns used by __str__ and save()
+BASE_FIELDS=['id', 'slug', 'user', 'user__id', 'user__username']
+
+def get_financial_info(request, *analyses):
+    """
+    Fetches the requesting user's FinancialInfo row at most once per request.
+    The lookup goes through the unique user_id index of the one-to-one relation, and the URL slug is
+    not used, so a user can only ever read their own row
+    Input:
+        request (HttpRequest): Current request, the row is memoized on it
+        analyses (String): Names of the analyses that will read the row, see ANALYSIS_FIELDS
+    Output: FinancialInfo with the user selected and only the needed fields loaded
+    """
+    fields=set(BASE_FIELDS)
+    for analysis in analyses:
+        fields.update(ANALYSIS_FIELDS[analysis])
+    memo=getattr(request, '_financial_info', None)
+    if memo is not None:
+        if fields<=memo[0]:
+            return memo[1]
+        #Keep what earlier callers asked for so their fields stay loaded on the new instance
+        fields|=memo[0]
+    with metrics.timer('db_fetch'):
+        financial_info=FinancialInfo.objects.select_related('user').only(*fields).get(user__id=request.user.id)
+    request._financial_info=(fields, financial_info)
+    return financial_info
+
+class FinancialInfoMixin:
+    """
+    View mixin giving access to the request's memoized FinancialInfo row
+    """
+    analyses=()
+
+    def get_financial_info(self):
+        return get_financial_info(self.request, *self.analyses)
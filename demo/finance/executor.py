@@ -0,0 +1,47 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+
+class Saturated(Exception):
+    """
+    Raised when every worker is busy and the wait queue is full
+    """
+
+class BoundedExecutor:
+    """
+    Thread pool with a fixed number of slots, running plus queued calls. Once the slots are taken new calls
+    are refused straight away instead of piling up behind slow simulations
+    Input:
+        workers (Int): Threads running numerical work
+        queue (Int): Calls allowed to wait for a free thread
+    """
+    def __init__(self, workers, queue):
+        self.pool=ThreadPoolExecutor(max_workers=workers, thread_name_prefix='finance-async')
+        self.slots=threading.BoundedSemaphore(workers+queue)
+
+    async def run(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise Saturated()
+        try:
+            future=self.pool.submit(fn, *args)
+        except BaseException:
+            #Nothing was queued, e.g. after shutdown, the slot must not leak
+            self.slots.release()
+            raise
+        #Free the slot when the work ends, not when the request does, a dropped client does not stop the thread
+        future.add_done_callback(lambda f: self.slots.release())
+        return await asyncio.wrap_future(future)
+
+_executor=None
+_executor_lock=threading.Lock()
+
+def get_executor():
+    """
+    Output: Bounded executor shared by every async view of this worker, created on first use
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor=BoundedExecutor(getattr(settings, 'FINANCE_ASYNC_WORKERS', 4), getattr(settings, 'FINANCE_ASYNC_QUEUE', 8))
+    return _executor
@@ -11,7 +11,7 @@ class FinancialInfoForm(forms.ModelForm):
     death_age=forms.IntegerField(validators=[validators.MinValueValidator(1), validators.MaxValueValidator(120)])
     retirement_age=forms.IntegerField(validators=[validators.MinValueValidator(1), validators.MaxValueValidator(120)])
     class Meta:
-        exclude=['user', 'slug']
+        exclude=['user', 'slug', 'fwb_score']
         model=FinancialInfo
     
     def clean(self):
@@ -1,43 +1,52 @@
+import logging
 import numpy as np
-import scipy.stats as stats
-import random
-from bokeh.io import show
-from bokeh.plotting import figure
-from bokeh.embed import components
-from bokeh.models import HoverTool
 import time
 import sys
+from finance.cashflow import incomeSchedule, spendingSchedule
+from finance.solver import solveUserReqReturn
+from finance.parallel import parallelSimulation
+from finance.sketch import QuantileSketch
+from finance import metrics
 
-def investmentResult(investmentRisk, userCurrentAge, userDeathAge):
+logger=logging.getLogger(__name__)
+
+def riskReturnProfile(investmentRisk):
     """
-    Identifies user portfolio risk-return characteristics for simulation
+    Maps the user selected investment riskiness ranking to portfolio risk-return characteristics
     Input: 
         investmentRisk (Int): User selected investment riskiness ranking
-        userCurrentAge (Int): User current age
-        userDeathAge (Int): User expected mortality age, used to calculate life expectancy
-    Output: List of simulated yearly investment return until death
+    Output: Tuple of (expected yearly return, yearly return standard deviation)
     """
-    #Set risk and return
-    yearlyInvestmentResult = []
     if investmentRisk < 2: 
-        assetReturn = 0.01
-        assetRisk = 0.01
+        return (0.01, 0.01)
     elif investmentRisk < 4:
-        assetReturn = 0.03
-        assetRisk = 0.08
+        return (0.03, 0.08)
     elif investmentRisk < 6:
-        assetReturn = 0.05
-        assetRisk = 0.1
+        return (0.05, 0.1)
     elif investmentRisk < 8:
-        assetReturn = 0.07
-        assetRisk = 0.15
+        return (0.07, 0.15)
     else:
-        assetReturn = 0.1
-        assetRisk = 0.2
-    #Specify investment result using Monte Carlo simulation
-    for i in range(userCurrentAge, userDeathAge):
-        yearlyInvestmentResult.append(random.gauss(assetReturn, assetRisk))
-    return yearlyInvestmentResult
+        return (0.1, 0.2)
+
+
+def investmentResult(investmentRisk, userCurrentAge, userDeathAge, trials=None, rng=None):
+    """
+    Identifies user portfolio risk-return characteristics for simulation
+    Input: 
+        investmentRisk (Int): User selected investment riskiness ranking
+        userCurrentAge (Int): User current age
+        userDeathAge (Int): User expected mortality age, used to calculate life expectancy
+        trials (Int): Number of simulation trials to draw at once. None draws a single trial
+        rng (numpy.random.Generator): Random generator used for the draws
+    Output: Array of simulated yearly investment return until death, shaped (years,) or (years, trials)
+    """
+    assetReturn, assetRisk = riskReturnProfile(investmentRisk)
+    if rng is None:
+        rng = np.random.default_rng()
+    years = userDeathAge-userCurrentAge
+    #Specify investment result using Monte Carlo simulation, one row of draws per year
+    size = years if trials is None else (years, trials)
+    return rng.normal(assetReturn, assetRisk, size=size)
 
 
 def yearlyTotalIncome(userIncome, incomeGrowth, userCurrentAge, userDeathAge, userRetirementAge):
@@ -49,15 +58,9 @@ def yearlyTotalIncome(userIncome, incomeGrowth, userCurrentAge, userDeathAge, us
         userCurrentAge (Int): User current age
         userDeathAge (Int): User expected mortality age, used to calculate life expectancy
         userRetirementAge (Int): User retirement age
-    Output: List of extrapolated yearly income until death age. 
+    Output: Read-only array of extrapolated yearly income until death age, shared through the cash-flow memo
     """
-    lifetimeIncome = []
-    for i in range(userCurrentAge, userDeathAge):
-        if i <= userRetirementAge:
-            lifetimeIncome.append(userIncome*((1+incomeGrowth)**(i-userCurrentAge)))
-        else:
-            lifetimeIncome.append(0)
-    return lifetimeIncome
+    return incomeSchedule(userIncome, incomeGrowth, userCurrentAge, userDeathAge, userRetirementAge)
 
 
 def yearlyTotalSpending(userSpending, inflation, userCurrentAge, userDeathAge):
@@ -68,28 +71,32 @@ def yearlyTotalSpending(userSpending, inflation, userCurrentAge, userDeathAge):
         inflation (Float): Decimal figure that indicates the spending growth rate every year
         userCurrentAge (Int): User current age
         userDeathAge (Int): User expected mortality age, used to calculate life expectancy
-    Output: List of extrapolated yearly spending until death age
+    Output: Read-only array of extrapolated yearly spending until death age, shared through the cash-flow memo
     """
-    lifetimeSpending = []
-    for i in range(userCurrentAge, userDeathAge):
-        lifetimeSpending.append(userSpending*((1+inflation)**(i-userCurrentAge)))
-    return lifetimeSpending
+    return spendingSchedule(userSpending, inflation, userCurrentAge, userDeathAge)
 
-def simGraph(yearlyResult):
+def simGraph(summary):
     """
     Visualize yearly result to show average and worst case scenarios
     Input: 
-        yearlyResult (List): A nested list of simulations over multiple years
+        summary (QuantileSketch): Streaming summary of simulations over multiple years
     Output: A graph of results that plots the different possible scenarios
     """
-    worstCase = []
-    poorCase = []
-    averageCase = []
-    for i in yearlyResult:
-        worstCase.append(np.percentile(i, 5))
-        poorCase.append(np.percentile(i, 25))
-        averageCase.append(np.percentile(i, 50))
-    
+    worstCase, poorCase, averageCase = summary.percentile([5, 25, 50])
+    return simPercentileGraph(worstCase, poorCase, averageCase)
+
+def simPercentileGraph(worstCase, poorCase, averageCase):
+    """
+    Plots precomputed yearly percentiles of simulated wealth
+    Input:
+        worstCase (List): Yearly 5th percentile of simulated wealth
+        poorCase (List): Yearly 25th percentile of simulated wealth
+        averageCase (List): Yearly median of simulated wealth
+    Output: Bokeh script and div of the graph
+    """
+    #Bokeh is only needed for server side rendering, keep it out of worker startup
+    from bokeh.plotting import figure
+    from bokeh.embed import components
     x=[str(i) for i in range(len(poorCase))]
     p=figure(x_range=x, 
             plot_height=500, 
@@ -106,15 +113,35 @@ def simGraph(yearlyResult):
     script,div = components(p)
     return (script,div)
 
-def simOutputClassification(netWealth):
+def simSeries(summary):
+    """
+    Compact chart data of the simulation, plotted client side instead of rendering a Bokeh figure
+    Input:
+        summary (QuantileSketch): Streaming summary of simulations over multiple years
+    Output: Dictionary of yearly 5th, 25th and 50th percentile wealth rounded to cents
+    """
+    worstCase, poorCase, averageCase = np.round(summary.percentile([5, 25, 50]), 2)
+    return {'worst_case':worstCase.tolist(), 'poor_case':poorCase.tolist(), 'average_case':averageCase.tolist()}
+
+def simOutputClassification(summary):
     """
     Classification of simulation data to present diagnosis result
     Input:
-        netWealth (List): List of possible wealth outcome for the simulation trials
+        summary (QuantileSketch): Streaming summary of the simulation trials
+    Output: String of diagnostic content
+    """
+    p = summary.percentile(5)[-1]
+    probRuin = summary.ruinProbability()
+    return simDiagnosis(p, probRuin)
+
+def simDiagnosis(p, probRuin):
+    """
+    Diagnostic content of summarized simulation data
+    Input:
+        p (Float): 5th percentile of terminal wealth
+        probRuin (Float): Percentage of trials ending without money
     Output: String of diagnostic content
     """
-    p = np.percentile(netWealth, 5)
-    probRuin = stats.percentileofscore(netWealth, 0)
     if probRuin < 1 :
         return ("Congratulations, your financial situation is excellent! In the worst case you will have " + str(p) + " dollars left. And the chance for you to get into financial trouble is: " + str(probRuin) + "%")
     elif probRuin <= 5:
@@ -153,59 +180,188 @@ def reqReturnOutputClassification(reqReturn):
     elif reqReturn >= .09:
         return ("You are in a very dangerous financial condition.... Your required return is: " + str(reqReturn*100) + "% or above")
 
-def simHealthCheck(userIncome, incomeGrowth, userSpending, inflation, userSavings, investmentRisk, userCurrentAge, userDeathAge, userRetirementAge):
+def simulateSavings(lifetimeIncome, lifetimeSpending, userSavings, yearlyInvestmentResult):
+    """
+    Vectorized savings engine: advances every simulation trial one year at a time
+    Input:
+        lifetimeIncome (List): Extrapolated yearly income until death age
+        lifetimeSpending (List): Extrapolated yearly spending until death age
+        userSavings (Int): Current savings level
+        yearlyInvestmentResult (Array): Simulated yearly returns shaped (years, trials)
+    Output: Array of yearly savings shaped (years, trials). Negative balances earn no return
+    """
+    years, trials = yearlyInvestmentResult.shape
+    netCashFlow = np.asarray(lifetimeIncome, dtype=np.float64) - np.asarray(lifetimeSpending, dtype=np.float64)
+    yearlyDetails = np.empty((years, trials))
+    savings = np.full(trials, float(userSavings))
+    growth = np.empty(trials)
+    for j in range(years):
+        np.add(yearlyInvestmentResult[j], 1, out=growth)
+        np.multiply(savings, growth, out=savings, where=savings >= 0)
+        savings += netCashFlow[j]
+        yearlyDetails[j] = savings
+    return yearlyDetails
+
+def simSummary(lifetimeIncome, lifetimeSpending, userSavings, investmentRisk, trials, rng, batchSize=5000, drawReturns=None):
+    """
+    Streaming aggregation stage: simulates trials in batches and folds each batch into a mergeable summary,
+    so memory stays constant in the trial count. A single batch yields exact 5/25/50th percentiles
+    Input:
+        lifetimeIncome (List): Extrapolated yearly income until death age
+        lifetimeSpending (List): Extrapolated yearly spending until death age
+        userSavings (Int): Current savings level
+        investmentRisk (Int): User selected investment riskiness ranking
+        trials (Int): Number of simulation trials
+        rng (numpy.random.Generator): Random generator used for the draws
+        batchSize (Int): Maximum number of trials held in memory at once
+        drawReturns (Function): Optional drawReturns(trials, rng) returning yearly returns shaped (years, trials),
+            replacing the single Gaussian of investmentRisk, for example a multi-asset portfolio model
+    Output: QuantileSketch of the yearly savings
+    """
+    years = len(lifetimeIncome)
+    if drawReturns is None:
+        drawReturns = lambda trials, rng: investmentResult(investmentRisk, 0, years, trials=trials, rng=rng)
+    summary = None
+    for start in range(0, trials, batchSize):
+        #Draw the whole (years x batch) return matrix at once
+        with metrics.timer('return_draws'):
+            yearlyInvestmentResult = drawReturns(min(batchSize, trials-start), rng)
+        with metrics.timer('simulation_loop'):
+            yearlyDetails = simulateSavings(lifetimeIncome, lifetimeSpending, userSavings, yearlyInvestmentResult)
+        with metrics.timer('percentiles'):
+            batch = QuantileSketch.fromPaths(yearlyDetails)
+            summary = batch if summary is None else QuantileSketch.merge([summary, batch])
+    return summary
+
+#Ruin probability boundaries (%) between the diagnosis classes of simDiagnosis
+ruinThresholds = [1, 5, 10, 20, 30, 40]
+
+def simDecided(summary, z=1.96):
+    """
+    Checks whether more trials could still change the diagnosis
+    Input:
+        summary (QuantileSketch): Summary of the trials run so far
+        z (Float): Normal quantile of the confidence level
+    Output: True once the Wilson interval of the ruin probability lies within one diagnosis class
+        and the order statistic interval of the 5th percentile terminal wealth does not contain zero
+    """
+    n = summary.count
+    p = summary.ruinProbability()/100
+    center = (p + z*z/(2*n))/(1 + z*z/n)
+    halfWidth = z*np.sqrt(p*(1-p)/n + z*z/(4*n*n))/(1 + z*z/n)
+    low, high = 100*(center-halfWidth), 100*(center+halfWidth)
+    if any(low < t < high for t in ruinThresholds):
+        return False
+    spread = z*np.sqrt(0.05*0.95/n)
+    worstLow, worstHigh = summary.percentile([max(0.05-spread, 0)*100, (0.05+spread)*100])[:, -1]
+    return worstLow > 0 or worstHigh < 0
+
+def simAdaptiveSummary(lifetimeIncome, lifetimeSpending, userSavings, investmentRisk, rng, batchSize=500, maxTrials=5000, drawReturns=None):
+    """
+    Adaptive aggregation stage: keeps adding batches of trials until the diagnosis is decided or the cap is reached
+    Input: Same as simSummary, with maxTrials capping the number of trials
+    Output: QuantileSketch of the yearly savings, its count is the number of trials actually used
+    """
+    years = len(lifetimeIncome)
+    if drawReturns is None:
+        drawReturns = lambda trials, rng: investmentResult(investmentRisk, 0, years, trials=trials, rng=rng)
+    summary = None
+    while summary is None or (summary.count < maxTrials and not simDecided(summary)):
+        trials = min(batchSize, maxTrials-(0 if summary is None else summary.count))
+        with metrics.timer('return_draws'):
+            yearlyInvestmentResult = drawReturns(trials, rng)
+        with metrics.timer('simulation_loop'):
+            yearlyDetails = simulateSavings(lifetimeIncome, lifetimeSpending, userSavings, yearlyInvestmentResult)
+        with metrics.timer('percentiles'):
+            batch = QuantileSketch.fromPaths(yearlyDetails)
+            summary = batch if summary is None else QuantileSketch.merge([summary, batch])
+    return summary
+
+def simHealthSummary(userIncome, incomeGrowth, userSpending, inflation, userSavings, investmentRisk, userCurrentAge, userDeathAge, userRetirementAge, trials=5000, seed=None, workers=None, shardSize=2500, batchSize=5000, adaptive=False, portfolio=None, scenarioBank=None, drawSeed=None):
+    """
+    Runs the Monte Carlo simulation of a user
+    Input: User financial information, number of simulation trials and an optional random seed.
+        Setting workers runs shards of shardSize trials across that many processes, reproducible for every worker count.
+        Sharded runs always simulate every trial, adaptive is ignored. Otherwise adaptive runs batches of batchSize trials and stops early once the diagnosis is decided, with trials as the cap.
+        A PortfolioModel as portfolio draws correlated multi-asset returns along the glide path of investmentRisk, in this process and ignoring workers.
+        The path of a scenario bank as scenarioBank scales its pre-generated shocks instead of drawing, in this process, ignoring workers and without a seed.
+        Otherwise drawSeed reuses the memoized shocks of that seed, so changing the cash flows or the risk level draws nothing new
+    Output: Tuple of (QuantileSketch of the yearly savings, diagnosis result)
+    """
+    with metrics.timer('schedules'):
+        lifetimeIncome = yearlyTotalIncome(userIncome, incomeGrowth, userCurrentAge, userDeathAge, userRetirementAge)
+        lifetimeSpending = yearlyTotalSpending(userSpending, inflation, userCurrentAge, userDeathAge)
+    drawReturns = None
+    if portfolio is not None:
+        from finance.portfolio import riskGlidePath
+        weights = riskGlidePath(investmentRisk, userCurrentAge, userRetirementAge, userDeathAge)
+        drawReturns = lambda trials, rng: portfolio.portfolioReturns(weights, trials, rng)
+        if workers is not None:
+            logger.warning('Portfolio simulations run in this process, ignoring workers=%s', workers)
+        workers = None
+    elif scenarioBank is not None or drawSeed is not None:
+        from finance.scenarios import bankDraws, openBank, seededShocks
+        shocks = openBank(scenarioBank) if scenarioBank is not None else None
+        if shocks is not None and (shocks.shape[0] < len(lifetimeIncome) or shocks.shape[1] < trials):
+            #Horizons or trial counts beyond the bank fall back to seeded draws, like sweeps and cohort reports do
+            shocks = None
+        if shocks is None and drawSeed is not None:
+            shocks = seededShocks(len(lifetimeIncome), trials, drawSeed)
+        if shocks is not None:
+            assetReturn, assetRisk = riskReturnProfile(investmentRisk)
+            drawReturns = bankDraws(shocks, assetReturn, assetRisk, len(lifetimeIncome))
+            if workers is not None:
+                logger.warning('Scenario bank simulations run in this process, ignoring workers=%s', workers)
+            workers = None
+    if workers is not None:
+        if adaptive:
+            logger.warning('Sharded simulations run all %s trials, ignoring adaptive', trials)
+        assetReturn, assetRisk = riskReturnProfile(investmentRisk)
+        summary = parallelSimulation(lifetimeIncome, lifetimeSpending, userSavings, assetReturn, assetRisk, trials, seed=seed, workers=workers, shardSize=shardSize)
+    elif adaptive:
+        summary = simAdaptiveSummary(lifetimeIncome, lifetimeSpending, userSavings, investmentRisk, np.random.default_rng(seed), batchSize=batchSize, maxTrials=trials, drawReturns=drawReturns)
+    else:
+        summary = simSummary(lifetimeIncome, lifetimeSpending, userSavings, investmentRisk, trials, np.random.default_rng(seed), batchSize=batchSize, drawReturns=drawReturns)
+    with metrics.timer('diagnosis'):
+        result_description= simOutputClassification(summary)
+    if adaptive and workers is None:
+        result_description += " (Based on " + str(summary.count) + " simulated lifetimes.)"
+    return (summary, result_description)
+
+def simHealthCheck(*args, **kwargs):
     """
     Monte Carlo based financial health check function: Using simulation to test the expected financial situation of user
-    Input: User financial information
-    Output: Diagnosis result
-    """
-    yearlyDetails = [[] for _ in range(userDeathAge-userCurrentAge)]#create a nested list to hold yearly savings
-    lifetimeIncome = yearlyTotalIncome(userIncome, incomeGrowth, userCurrentAge, userDeathAge, userRetirementAge)
-    lifetimeSpending = yearlyTotalSpending(userSpending, inflation, userCurrentAge, userDeathAge)
-    userCurrentSavings = userSavings
-    for i in range(5000):#Repeat Lifetime 5000 times    
-        userSavings = userCurrentSavings
-        yearlyInvestmentResult = investmentResult(investmentRisk, userCurrentAge, userDeathAge)
-        for j in range(userCurrentAge-userCurrentAge, userDeathAge-userCurrentAge):
-            #Calculate net savings every period
-            if userSavings < 0:
-                userSavings = userSavings + lifetimeIncome[j] - lifetimeSpending[j]
-            else:
-                userSavings = (userSavings*(1+yearlyInvestmentResult[j]) + lifetimeIncome[j] - lifetimeSpending[j])
-            yearlyDetails[j].append(userSavings)
-    script,div = simGraph(yearlyDetails)
-    result_description= simOutputClassification(yearlyDetails[userDeathAge-userCurrentAge-1])
+    Input: User financial information and simulation options, see simHealthSummary
+    Output: Diagnosis result with the Bokeh script and div of its graph
+    """
+    summary, result_description = simHealthSummary(*args, **kwargs)
+    with metrics.timer('bokeh_render'):
+        script,div = simGraph(summary)
     return (result_description, script, div)
 
+def simHealthCheckData(*args, **kwargs):
+    """
+    Monte Carlo based financial health check function returning chart data instead of a rendered graph
+    Input: User financial information and simulation options, see simHealthSummary
+    Output: Diagnosis result with the chart data of simSeries
+    """
+    summary, result_description = simHealthSummary(*args, **kwargs)
+    with metrics.timer('chart_series'):
+        series = simSeries(summary)
+    return (result_description, series)
+
 def reqReturnHealthCheck(userIncome, incomeGrowth, userSpending, inflation, userSavings, userCurrentAge, userDeathAge, userRetirementAge):
     """
-    Required return based financial health check function: Using bisection search to find the needed return level to sustain spending throughout planning horizon
+    Required return based financial health check function: Using a vectorized grid scan refined by Brent's method to find the needed return level to sustain spending throughout planning horizon
     Input: User financial information
     Output: User required return to achieve financial goal. 
     """
-    lifetimeIncome = yearlyTotalIncome(userIncome, incomeGrowth, userCurrentAge, userDeathAge, userRetirementAge)
-    lifetimeSpending = yearlyTotalSpending(userSpending, inflation, userCurrentAge, userDeathAge)
-    minReqReturn = 0
-    maxReqReturn = 0.2#20% is a very high return requirement
-    userCurrentSavings = userSavings
-    for i in range(200):#Don't want to enter a loop forever in case there's no solution
-        reqReturn = (minReqReturn + maxReqReturn)/2
-        userSavings = userCurrentSavings#Reset financial condition
-        for i in range(userCurrentAge-userCurrentAge, userDeathAge-userCurrentAge):
-            if userSavings < 0:
-                userSavings = userSavings + lifetimeIncome[i] - lifetimeSpending[i]
-            else:
-                userSavings = (userSavings*(1+reqReturn) + lifetimeIncome[i] - lifetimeSpending[i])
-        if abs(userSavings) <= 1:#Solution found
-            break
-        elif userSavings >1:
-            maxReqReturn = reqReturn
-        elif userSavings <1:
-            minReqReturn = reqReturn
+    with metrics.timer('req_return_solve'):
+        reqReturn, _ = solveUserReqReturn(userIncome, incomeGrowth, userSpending, inflation, userSavings, userCurrentAge, userDeathAge, userRetirementAge)
     return reqReturnOutputClassification(reqReturn)
 
 if __name__=='__main__':
-    result_description, result_plot = simHealthCheck(userIncome=100, 
+    result_description, script, div = simHealthCheck(userIncome=100, 
                     incomeGrowth=0.05, 
                     userSpending=90, 
                     inflation=0.03, 
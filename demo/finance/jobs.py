@@ -0,0 +1,148 @@
+import json
+import os
+from functools import lru_cache
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from finance import cache as finance_cache
+from finance.pipeline import stage_fields
+from finance.models import SimulationJob
+
+_executor=None
+_executor_lock=threading.Lock()
+
+def get_executor():
+    """
+    Output: Process pool shared by every background simulation of this worker, created on first use
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor=ProcessPoolExecutor(max_workers=getattr(settings, 'FINANCE_JOB_WORKERS', 2))
+    return _executor
+
+def shutdown_executor():
+    """
+    Shuts down the job pool of this worker without waiting for running simulations, the next submission starts a new one
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor=_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def simulation_arguments(q):
+    return (q.income, q.income_growth, q.spending, q.inflation, q.savings, q.investment_risk, q.current_age, q.death_age, q.retirement_age)
+
+def simulation_seed(q):
+    """
+    Output: Seed of the return draws stage, it only depends on the fields of that stage so editing
+        spending or savings reuses the same draws
+    """
+    return int(finance_cache.input_digest('return_draws', q, stage_fields('return_draws'))[:8], 16)
+
+@lru_cache(maxsize=None)
+def portfolio_model(distribution, history=None):
+    """
+    Output: PortfolioModel of the default asset classes, or bootstrapping the yearly returns saved at the history path,
+        built once per process so its buffers are reused across requests
+    """
+    from finance.portfolio import PortfolioModel
+    if distribution=='bootstrap':
+        import numpy as np
+        return PortfolioModel.fromHistory(np.load(history))
+    return PortfolioModel.default(distribution)
+
+def simulation_options(q=None, background=False):
+    """
+    Output: Trial, worker count, shard size and seed keyword arguments of simHealthCheck taken from settings.
+        Given the financial information row q the draws are seeded from it
+    """
+    workers=getattr(settings, 'FINANCE_SIM_WORKERS', None)
+    if background and workers is not None:
+        #Job processes do not start a pool of their own, they run the same seeded shards inline
+        workers=1
+    options={'trials':getattr(settings, 'FINANCE_SIM_TRIALS', 5000), 'workers':workers}
+    if workers is not None:
+        options['shardSize']=getattr(settings, 'FINANCE_SIM_SHARD_SIZE', 2500)
+    distribution=getattr(settings, 'FINANCE_SIM_PORTFOLIO', None)
+    if distribution:
+        options['portfolio']=portfolio_model(distribution, getattr(settings, 'FINANCE_SIM_PORTFOLIO_HISTORY', None))
+    if q is not None:
+        #In-process runs reuse the memoized draws, sharded and portfolio runs seed their own draws with it
+        options['drawSeed' if workers is None and not distribution else 'seed']=simulation_seed(q)
+    if getattr(settings, 'FINANCE_SIM_ADAPTIVE', False):
+        options.update(adaptive=True, batchSize=getattr(settings, 'FINANCE_SIM_BATCH_SIZE', 500))
+    scenario_bank=getattr(settings, 'FINANCE_SCENARIO_BANK', None)
+    if scenario_bank and os.path.exists(scenario_bank):
+        options['scenarioBank']=scenario_bank
+    return options
+
+def run_simulation(*args, data=False, **options):
+    #Imported in the worker process so the parent never pays for numpy/bokeh just to queue a job
+    from finance import health_check
+    if data:
+        return health_check.simHealthCheckData(*args, **options)
+    return health_check.simHealthCheck(*args, **options)
+
+def submit_simulation(financial_info, kind='simulation'):
+    """
+    Queues a background simulation for a financial information row, merging it into an identical recent pending job
+    Input:
+        financial_info (FinancialInfo): User financial information row
+        kind (String): 'simulation' for the Bokeh page or 'simulation_data' for the JSON chart series
+    Output: SimulationJob tracking the run
+    """
+    key=finance_cache.cache_key(kind, financial_info, finance_cache.SIMULATION_FIELDS)
+    now=timezone.now()
+    #Jobs pending for longer were orphaned, e.g. by a worker restart, and will never finish
+    cutoff=now-timedelta(seconds=getattr(settings, 'FINANCE_JOB_TIMEOUT', 300))
+    SimulationJob.objects.filter(key=key, status=SimulationJob.PENDING, created_at__lt=cutoff).update(
+        status=SimulationJob.FAILED, error='Timed out', finished_at=now, pending_key=None)
+    job=SimulationJob.objects.filter(pending_key=key).first()
+    if job is not None:
+        return job
+    try:
+        with transaction.atomic():
+            job=SimulationJob.objects.create(financial_info=financial_info, key=key, pending_key=key)
+    except IntegrityError:
+        #An identical request created the pending job since the lookup above, share it (or its result if already finished)
+        return SimulationJob.objects.filter(key=key).latest('created_at')
+    future=get_executor().submit(run_simulation, *simulation_arguments(financial_info), data=kind=='simulation_data',
+                                 **simulation_options(financial_info, background=True))
+    submitter=threading.get_ident()
+    #An already finished future runs the callback right here, in the request thread
+    future.add_done_callback(lambda f: finish_simulation(job.pk, financial_info, f, pool_thread=threading.get_ident()!=submitter, kind=kind))
+    return job
+
+def finish_simulation(job_pk, financial_info, future, pool_thread=True, kind='simulation'):
+    """
+    Records a finished simulation on its job and in the result cache
+    Input:
+        pool_thread (Bool): Whether this runs on the executor's management thread rather than in a request
+    """
+    try:
+        job=SimulationJob.objects.get(pk=job_pk)
+        try:
+            result=future.result()
+        except Exception as e:
+            job.status=SimulationJob.FAILED
+            job.error=repr(e)
+        else:
+            if kind=='simulation_data':
+                job.diagnosis, series=result
+                job.series=json.dumps(series)
+            else:
+                job.diagnosis, job.script, job.div=result
+            job.status=SimulationJob.DONE
+            finance_cache.store(kind, financial_info, finance_cache.SIMULATION_FIELDS, result)
+        job.finished_at=timezone.now()
+        job.pending_key=None
+        job.save()
+    finally:
+        #Release the connection the executor's management thread opened, never the request's own
+        if pool_thread:
+            connection.close()
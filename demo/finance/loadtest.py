@@ -0,0 +1,299 @@
+import http.client
+import os
+import random
+import re
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.parse import urlencode
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer, get_internal_wsgi_application
+from django.db import connections
+from django.urls import reverse
+from django.utils.text import slugify
+from finance import jobs, parallel
+from finance.models import FinancialInfo
+
+#Relative weights of the endpoints in the traffic mix. simulation_data is where the JSON chart mode runs or queues the Monte Carlo engine
+ENDPOINTS={'simulation':3, 'simulation_data':3, 'req_return':3, 'prediction':3, 'profile':2, 'login':1, 'bbc_clone':1}
+#Statuses of a successful response, anything else counts as an error. A queued simulation answers 202
+EXPECTED_STATUS={'login':(302,), 'simulation_data':(200, 202)}
+PASSWORD='load-test-pass-123'
+#Seconds stop() waits for a worker process group after SIGTERM before killing it
+STOP_TIMEOUT=10
+csrf_cookie=re.compile(r'csrftoken=([^;]+)')
+csrf_field=re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+def seed_users(count, seed=0):
+    """
+    Creates users with randomized financial information, sharing one password hash so seeding skips the slow hasher
+    Input:
+        count (Int): Number of users
+        seed (Int): Seed of the randomized answers
+    Output: List of the created FinancialInfo rows with their users
+    """
+    rng=random.Random(seed)
+    User=get_user_model()
+    password=make_password(PASSWORD)
+    User.objects.bulk_create([User(username='loadtest%d' % i, password=password) for i in range(count)])
+    users=User.objects.filter(username__startswith='loadtest').order_by('pk')
+    rows=[]
+    for user in users:
+        income=rng.randrange(30000, 150000, 1000)
+        current_age=rng.randint(22, 60)
+        rows.append(FinancialInfo(user=user, slug=slugify(user.username), income=income, income_growth=rng.uniform(0.01, 0.04),
+            spending=int(income*rng.uniform(0.5, 1.0)), inflation=0.02, savings=rng.randrange(0, 200000, 1000),
+            current_age=current_age, retirement_age=rng.randint(current_age+5, 70), death_age=rng.randint(85, 100),
+            investment_risk=rng.choice([1, 3, 5, 7, 9]),
+            **{field:rng.choice(FinancialInfo._meta.get_field(field).choices)[0] for field in ['FWB1_3', 'FWB1_5', 'FWB1_6', 'FWB2_1', 'FWB2_3']}))
+    FinancialInfo.objects.bulk_create(rows)
+    return list(FinancialInfo.objects.filter(user__in=users).select_related('user').order_by('pk'))
+
+def session_cookie(user):
+    """
+    Logs a user in server side, the way the test client's force_login does
+    Output: Cookie header value of the new session
+    """
+    session=import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY]=str(user.pk)
+    session[BACKEND_SESSION_KEY]=settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY]=user.get_session_auth_hash()
+    session.save()
+    return '%s=%s' % (settings.SESSION_COOKIE_NAME, session.session_key)
+
+def targets(rows):
+    """
+    Output: List of per-user dictionaries of the username, session cookie and endpoint paths
+    """
+    result=[]
+    for row in rows:
+        paths={name:reverse('finance:'+name, kwargs={'slug':row.slug}) for name in ['simulation', 'simulation_data', 'req_return', 'prediction', 'profile']}
+        paths['bbc_clone']=reverse('bbc_clone:clone')
+        paths['login']=reverse('accounts:login')
+        result.append({'username':row.user.username, 'cookie':session_cookie(row.user), 'paths':paths})
+    return result
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    """
+    WSGI server handling connections on a fixed number of threads, like one threaded worker of a production server
+    """
+    request_queue_size=128
+    threads=1
+
+    def serve_forever(self, poll_interval=0.5):
+        with ThreadPoolExecutor(self.threads) as self.pool:
+            super().serve_forever(poll_interval)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.handle_connection, request, client_address)
+
+    def handle_connection(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            #Database connections are per thread, give back the one this request used
+            connections.close_all()
+
+def make_server(port=0):
+    """
+    Output: PooledWSGIServer listening on localhost, on a free port unless one is given
+    """
+    server=PooledWSGIServer(('127.0.0.1', port), QuietRequestHandler)
+    server.set_app(get_internal_wsgi_application())
+    return server
+
+def serve_child(server):
+    """
+    Serves in a forked worker until SIGTERM, then shuts down the process pools the worker started so none outlives it
+    """
+    def terminate(signum, frame):
+        raise SystemExit
+    try:
+        os.setpgid(0, 0)
+        signal.signal(signal.SIGTERM, terminate)
+        server.serve_forever()
+    except SystemExit:
+        pass
+    finally:
+        jobs.shutdown_executor()
+        parallel.shutdownPools()
+        os._exit(0)
+
+def reap(pid, timeout):
+    """
+    Output: True once the child pid has exited, False if it is still running after timeout seconds
+    """
+    deadline=time.perf_counter()+timeout
+    while os.waitpid(pid, os.WNOHANG)==(0, 0):
+        if time.perf_counter()>deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+def start_workers(server, workers, threads):
+    """
+    Forks worker processes that accept connections on the shared listening socket, each with its own thread pool,
+    so worker processes do not share the GIL with each other or with the load generator.
+    Each worker leads its own process group, which also holds the process pools it starts
+    Output: Function stopping the workers and everything they started
+    """
+    server.threads=threads
+    if not hasattr(os, 'fork'):
+        if workers!=1:
+            raise ValueError('Several worker processes need os.fork, use a single worker')
+        thread=threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server.shutdown
+    #Forked children must not share the parent's database connections
+    connections.close_all()
+    pids=[]
+    for _ in range(workers):
+        pid=os.fork()
+        if pid==0:
+            serve_child(server)
+        try:
+            #Also set here so the group exists before stop() can signal it
+            os.setpgid(pid, pid)
+        except OSError:
+            pass
+        pids.append(pid)
+    def signal_group(pid, signum):
+        try:
+            os.killpg(pid, signum)
+        except ProcessLookupError:
+            pass
+    def stop():
+        for pid in pids:
+            signal_group(pid, signal.SIGTERM)
+        for pid in pids:
+            if not reap(pid, STOP_TIMEOUT):
+                signal_group(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            #Pool processes left behind by the worker
+            signal_group(pid, signal.SIGKILL)
+    return stop
+
+def fetch(port, method, path, headers, body=None):
+    connection=http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        connection.request(method, path, body=body, headers=headers)
+        response=connection.getresponse()
+        return (response.status, response.getheader('Set-Cookie', ''), response.read())
+    finally:
+        connection.close()
+
+def login(port, target):
+    """
+    Loads the login form and posts the user's credentials with its CSRF token
+    Output: Status of the POST, a redirect on success
+    """
+    path=target['paths']['login']
+    _, cookie, body=fetch(port, 'GET', path, {})
+    token=csrf_cookie.search(cookie).group(1)
+    form_token=csrf_field.search(body.decode()).group(1)
+    data=urlencode({'username':target['username'], 'password':PASSWORD, 'csrfmiddlewaretoken':form_token})
+    status, _, _=fetch(port, 'POST', path, {'Cookie':'csrftoken='+token, 'Content-Type':'application/x-www-form-urlencoded'}, data)
+    return status
+
+def generate_load(port, users, concurrency, duration, endpoints=ENDPOINTS, seed=0):
+    """
+    Sends requests from concurrency client threads, each picking an endpoint by weight and a user at random, for duration seconds
+    Output: List of (endpoint, latency in seconds, success) samples
+    """
+    names=list(endpoints)
+    weights=[endpoints[name] for name in names]
+    deadline=time.perf_counter()+duration
+    samples=[]
+    def client(n):
+        rng=random.Random(seed*1000+n)
+        while time.perf_counter()<deadline:
+            name=rng.choices(names, weights)[0]
+            target=rng.choice(users)
+            start=time.perf_counter()
+            try:
+                if name=='login':
+                    status=login(port, target)
+                else:
+                    status=fetch(port, 'GET', target['paths'][name], {'Cookie':target['cookie']})[0]
+            except (OSError, http.client.HTTPException, AttributeError):
+                #AttributeError: the login form came back without a CSRF token
+                status=None
+            #list.append is atomic, the threads can share the list
+            samples.append((name, time.perf_counter()-start, status in EXPECTED_STATUS.get(name, (200,))))
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    return samples
+
+def latency_summary(latencies):
+    p50, p95, p99=np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+    return {'p50_s':float(p50), 'p95_s':float(p95), 'p99_s':float(p99)}
+
+def summarize(samples, duration):
+    """
+    Output: Dictionary of throughput, error rate and latency percentiles overall and per endpoint
+    """
+    result={'requests':len(samples), 'throughput_rps':len(samples)/duration,
+            'error_rate':sum(not ok for _, _, ok in samples)/len(samples) if samples else 0.0}
+    result.update(latency_summary([latency for _, latency, _ in samples]))
+    result['endpoints']={}
+    for name in sorted({name for name, _, _ in samples}):
+        part=[(latency, ok) for n, latency, ok in samples if n==name]
+        entry={'requests':len(part), 'error_rate':sum(not ok for _, ok in part)/len(part)}
+        entry.update(latency_summary([latency for latency, _ in part]))
+        result['endpoints'][name]=entry
+    return result
+
+def format_summary(label, summary):
+    return '%-28s %7d req  %8.1f req/s  errors %5.1f%%  p50 %8.1f ms  p95 %8.1f ms  p99 %8.1f ms' % (
+        label, summary['requests'], summary['throughput_rps'], summary['error_rate']*100,
+        summary['p50_s']*1000, summary['p95_s']*1000, summary['p99_s']*1000)
+
+def run(users, workers=(1,), threads=(1, 4), concurrency=None, duration=10, warmup=2, endpoints=ENDPOINTS, seed=0, log=None):
+    """
+    Runs the traffic mix against every combination of worker process and thread counts
+    Input:
+        users (List): Targets built by targets()
+        workers, threads (List): Worker process and per-worker thread counts to try
+        concurrency (List): Client threads, defaults to twice the server threads of each configuration so requests queue
+        duration, warmup (Float): Measured seconds per configuration, after warmup seconds of unmeasured traffic
+    Output: List of dictionaries of the configuration and its summarize() results
+    """
+    server=make_server()
+    port=server.server_address[1]
+    results=[]
+    try:
+        for worker_count in workers:
+            for thread_count in threads:
+                for client_count in concurrency or [2*worker_count*thread_count]:
+                    stop=start_workers(server, worker_count, thread_count)
+                    try:
+                        if warmup:
+                            generate_load(port, users, client_count, warmup, endpoints, seed)
+                        start=time.perf_counter()
+                        samples=generate_load(port, users, client_count, duration, endpoints, seed)
+                        elapsed=time.perf_counter()-start
+                    finally:
+                        stop()
+                    entry=dict(summarize(samples, elapsed), workers=worker_count, threads=thread_count, concurrency=client_count)
+                    results.append(entry)
+                    if log:
+                        log(format_summary('workers=%d threads=%d clients=%d' % (worker_count, thread_count, client_count), entry))
+                        for name, part in entry['endpoints'].items():
+                            log(format_summary('    '+name, dict(part, throughput_rps=part['requests']/elapsed)))
+    finally:
+        server.server_close()
+    return results
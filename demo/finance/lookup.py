@@ -0,0 +1,123 @@
+import os
+import tempfile
+import threading
+import numpy as np
+from django.conf import settings
+from finance import metrics, prediction
+from finance.models import FinancialInfo
+from finance.prediction import encoding_order
+
+def answer_choices():
+    """
+    Output: List of the possible answers of each survey field, in encoding_order
+    """
+    return [[value for value, _ in FinancialInfo._meta.get_field(field).choices] for field in encoding_order]
+
+def combination_code(selection_dict, choices):
+    """
+    Mixed-radix code of a set of survey answers: each field is one digit, its answer's position in the choices
+    Input:
+        selection_dict (Dictionary): Survey answers keyed by field name
+        choices (List): Output of answer_choices
+    Output: Int between 0 and the number of combinations minus one
+    """
+    code=0
+    for field, values in zip(encoding_order, choices):
+        code=code*len(values)+values.index(selection_dict[field])
+    return code
+
+def all_combinations(choices):
+    """
+    Output: Every set of survey answers as dictionaries, ordered by combination_code
+    """
+    codes=np.arange(int(np.prod([len(values) for values in choices])))
+    digits=[]
+    for values in reversed(choices):
+        codes, digit=np.divmod(codes, len(values))
+        digits.append(digit)
+    return [{field:values[i] for field, values, i in zip(encoding_order, choices, row)} for row in zip(*reversed(digits))]
+
+class LookupTable:
+    """
+    Predictions of the FWB model for every possible set of survey answers, answering in O(1) without sklearn.
+    The table file records the content hash of the model files it was built from, it is rebuilt and checked
+    whenever they change
+    """
+    sample_size=32
+
+    def __init__(self, path=None, registry=prediction.registry):
+        self.path=path
+        self.registry=registry
+        self.choices=None
+        self.scores=None
+        self.signature=None
+        self.lock=threading.Lock()
+
+    def table_path(self):
+        return self.path or getattr(settings, 'FINANCE_PREDICTION_TABLE')
+
+    def read(self, version):
+        #A table built from other model files or other answer choices is ignored
+        try:
+            with np.load(self.table_path()) as table:
+                if str(table['version'])!=version or table['choices'].tolist()!=self.choices:
+                    return None
+                return table['scores']
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def build(self, version):
+        """
+        Runs the encoder and model once over every combination and writes the table atomically
+        Output: Array of scores indexed by combination_code
+        """
+        rows=all_combinations(self.choices)
+        scores=np.asarray(prediction.make_predictions(rows, encoding_order, self.registry), dtype=np.float64)
+        #Spot-check lookups by combination_code against single predictions before the table is trusted
+        sample=np.random.default_rng(0).choice(len(rows), size=min(self.sample_size, len(rows)), replace=False)
+        for i in sample:
+            if not np.isclose(scores[combination_code(rows[i], self.choices)], prediction.make_prediction(rows[i], encoding_order, self.registry)):
+                raise RuntimeError('The prediction table does not match the model')
+        #A temporary file of its own in the same directory, workers building at the same time never write into each other's
+        path=self.table_path()
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)), suffix='.npz', delete=False) as f:
+            try:
+                np.savez(f, scores=scores, version=np.array(version), choices=np.array(self.choices))
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, path)
+        return scores
+
+    def load(self, rebuild=False):
+        """
+        Reads the table, building it first when missing, stale or when rebuild is set
+        Output: Array of scores indexed by combination_code
+        """
+        with self.lock:
+            signature=self.registry.file_signature()
+            version=self.registry.file_hash()
+            self.choices=answer_choices()
+            scores=None if rebuild else self.read(version)
+            if scores is None:
+                scores=self.build(version)
+            scores.setflags(write=False)
+            self.scores=scores
+            self.signature=signature
+        return scores
+
+    def get(self):
+        """
+        Output: Array of scores, reloaded when the model files changed since the last load
+        """
+        if self.signature!=self.registry.file_signature():
+            return self.load()
+        return self.scores
+
+    def predict(self, selection_dict):
+        with metrics.timer('prediction_lookup'):
+            scores=self.get()
+            return scores[combination_code(selection_dict, self.choices)]
+
+table=LookupTable()
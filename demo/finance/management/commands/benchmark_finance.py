@@ -0,0 +1,30 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from finance import benchmark
+
+class Command(BaseCommand):
+    help='Benchmarks the finance health-check engines over planning horizons, trial counts and risk levels and writes JSON results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='finance_benchmark.json', help='JSON file the results are written to')
+        parser.add_argument('--compare', help='Earlier results file to check for regressions against')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative slowdown before a case counts as a regression')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--horizons', type=int, nargs='+', default=benchmark.HORIZONS)
+        parser.add_argument('--trials', type=int, nargs='+', default=benchmark.TRIALS)
+        parser.add_argument('--risks', type=int, nargs='+', default=benchmark.RISKS)
+        parser.add_argument('--skip-prediction', action='store_true', help='Leave out make_prediction, e.g. without the model dependencies')
+        parser.add_argument('--skip-accuracy', action='store_true', help='Leave out the error of the analytic preview against Monte Carlo')
+
+    def handle(self, *args, **options):
+        results=benchmark.run(repeat=options['repeat'], log=self.stdout.write, horizons=options['horizons'],
+                              trials=options['trials'], risks=options['risks'], prediction=not options['skip_prediction'], accuracy=not options['skip_accuracy'])
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS('Results written to %s' % options['output']))
+        if options['compare']:
+            with open(options['compare']) as f:
+                regressions=benchmark.compare(json.load(f), results, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions found:\n'+'\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against %s' % options['compare']))
@@ -0,0 +1,13 @@
+import time
+from django.core.management.base import BaseCommand
+from finance.lookup import table
+
+class Command(BaseCommand):
+    help='Builds the FWB prediction table over every combination of survey answers from the current model files'
+
+    def handle(self, *args, **options):
+        start=time.perf_counter()
+        scores=table.load(rebuild=True)
+        elapsed=time.perf_counter()-start
+        self.stdout.write(self.style.SUCCESS('Wrote %d predictions for model version %s to %s in %.2f seconds'
+            % (len(scores), table.registry.file_hash(), table.table_path(), elapsed)))
@@ -0,0 +1,20 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from finance.scenarios import buildBank
+
+class Command(BaseCommand):
+    help='Generates the scenario bank of standardized return shocks read by the simulations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.FINANCE_SCENARIO_BANK, help='Bank file, FINANCE_SCENARIO_BANK by default')
+        parser.add_argument('--years', type=int, default=100, help='Longest planning horizon covered')
+        parser.add_argument('--trials', type=int, default=20000, help='Scenarios per year, the most trials one simulation can use')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the shocks')
+
+    def handle(self, *args, **options):
+        start=time.perf_counter()
+        digest=buildBank(options['output'], years=options['years'], trials=options['trials'], seed=options['seed'])
+        elapsed=time.perf_counter()-start
+        self.stdout.write(self.style.SUCCESS('Wrote %d x %d scenarios to %s (digest %s) in %.2f seconds'
+            % (options['years'], options['trials'], options['output'], digest, elapsed)))
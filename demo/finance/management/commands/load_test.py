@@ -0,0 +1,50 @@
+import json
+import os
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+class Command(BaseCommand):
+    help='Load tests the finance, login and bbc_clone pages through an in-process server on a fresh SQLite database with seeded users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Seeded users with financial information')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2], help='Worker process counts to try')
+        parser.add_argument('--threads', type=int, nargs='+', default=[1, 4], help='Threads per worker to try')
+        parser.add_argument('--concurrency', type=int, nargs='+', help='Concurrent clients, twice the server threads by default')
+        parser.add_argument('--duration', type=float, default=10, help='Measured seconds per configuration')
+        parser.add_argument('--warmup', type=float, default=2, help='Unmeasured seconds of traffic before each measurement')
+        parser.add_argument('--endpoints', nargs='+', help='Subset of the traffic mix to send')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='JSON file the results are written to')
+
+    def handle(self, *args, **options):
+        from finance import loadtest
+        database=settings.DATABASES['default']
+        #The database is deleted and reseeded, only ever touch the throwaway one of the load test settings
+        if not getattr(settings, 'FINANCE_LOAD_TEST', False):
+            raise CommandError('The load test recreates the database, run it with --settings=demo.loadtest_settings')
+        if connections['default'].vendor!='sqlite' or database['NAME']==':memory:':
+            raise CommandError('The load test needs a file based SQLite database')
+        endpoints=loadtest.ENDPOINTS
+        if options['endpoints']:
+            unknown=set(options['endpoints'])-set(endpoints)
+            if unknown:
+                raise CommandError('Unknown endpoints: %s' % ', '.join(sorted(unknown)))
+            endpoints={name:endpoints[name] for name in options['endpoints']}
+        connections['default'].close()
+        if os.path.exists(database['NAME']):
+            os.remove(database['NAME'])
+        call_command('migrate', interactive=False, verbosity=0)
+        users=loadtest.targets(loadtest.seed_users(options['users'], options['seed']))
+        self.stdout.write('Seeded %d users in %s' % (len(users), database['NAME']))
+        try:
+            results=loadtest.run(users, workers=options['workers'], threads=options['threads'], concurrency=options['concurrency'],
+                                 duration=options['duration'], warmup=options['warmup'], endpoints=endpoints, seed=options['seed'], log=self.stdout.write)
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS('Results written to %s' % options['output']))
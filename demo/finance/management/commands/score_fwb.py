@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand
+from finance.models import FinancialInfo
+from finance.prediction import encoding_order, make_predictions
+
+class Command(BaseCommand):
+    help='Scores the FWB survey answers of every user in bulk and stores the results on FinancialInfo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows scored per predict call and bulk update')
+
+    def handle(self, *args, **options):
+        chunk_size=options['chunk_size']
+        start=time.perf_counter()
+        scored=0
+        chunk=[]
+        #Stream rows instead of loading the whole table
+        rows=FinancialInfo.objects.only('pk', *encoding_order).order_by('pk').iterator(chunk_size=chunk_size)
+        for info in rows:
+            chunk.append(info)
+            if len(chunk)>=chunk_size:
+                scored+=self.score(chunk)
+                chunk=[]
+        if chunk:
+            scored+=self.score(chunk)
+        elapsed=time.perf_counter()-start
+        self.stdout.write(self.style.SUCCESS('Scored %d users in %.2f seconds' % (scored, elapsed)))
+
+    def score(self, chunk):
+        predictions=make_predictions([{p:getattr(info, p) for p in encoding_order} for info in chunk], encoding_order)
+        for info, prediction in zip(chunk, predictions):
+            info.fwb_score=float(prediction)
+        FinancialInfo.objects.bulk_update(chunk, ['fwb_score'])
+        return len(chunk)
@@ -0,0 +1,26 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from finance import startup
+
+class Command(BaseCommand):
+    help='Reports per-module import time of a fresh worker, to track cold-start latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modules', nargs='*', default=startup.DEFAULT_MODULES, help='Modules imported after django.setup()')
+        parser.add_argument('--top', type=int, default=25, help='Number of slowest modules listed')
+        parser.add_argument('--warm-up', action='store_true', help='Include the finance warm-up hook')
+        parser.add_argument('--json', help='Also write the full report to this JSON file')
+
+    def handle(self, *args, **options):
+        try:
+            entries, elapsed=startup.profile_startup(options['modules'], warm=options['warm_up'])
+        except RuntimeError as e:
+            raise CommandError('Startup failed: %s' % e)
+        total=sum(e['self_s'] for e in entries)
+        self.stdout.write('%d modules imported in %.1f ms, interpreter startup took %.1f ms' % (len(entries), total*1000, elapsed*1000))
+        self.stdout.write('%12s %12s  %s' % ('self [ms]', 'cumul. [ms]', 'module'))
+        for entry in sorted(entries, key=lambda e: e['cumulative_s'], reverse=True)[:options['top']]:
+            self.stdout.write('%12.2f %12.2f  %s%s' % (entry['self_s']*1000, entry['cumulative_s']*1000, '  '*entry['depth'], entry['module']))
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump({'modules':options['modules'], 'warm_up':options['warm_up'], 'wall_s':elapsed, 'imports':entries}, f, indent=2)
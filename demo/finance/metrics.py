@@ -0,0 +1,118 @@
+import bisect
+import threading
+import time
+
+#Off by default, apps.ready switches it on from the FINANCE_METRICS setting. While off timer() hands back one
+#shared no-op object, so an instrumented stage costs a function call and nothing is recorded
+enabled=False
+
+#Upper bounds (seconds) of the latency histogram buckets
+buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_lock=threading.Lock()
+_histograms={}
+_counters={}
+_help={'finance_stage_seconds':'Time spent in each stage of the finance analyses',
+       'finance_request_seconds':'Time spent serving each view',
+       'finance_requests_total':'Requests served per view and status code'}
+
+class Histogram:
+    """
+    Cumulative latency histogram over the module buckets
+    """
+    def __init__(self):
+        self.counts=[0]*(len(buckets)+1)
+        self.sum=0.0
+        self.count=0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(buckets, value)]+=1
+        self.sum+=value
+        self.count+=1
+
+def labelKey(labels):
+    return tuple(sorted(labels.items()))
+
+def observe(name, seconds, **labels):
+    """
+    Records a duration in the histogram of a metric name and label set
+    """
+    with _lock:
+        series=_histograms.setdefault(name, {})
+        key=labelKey(labels)
+        if key not in series:
+            series[key]=Histogram()
+        series[key].observe(seconds)
+
+def increment(name, amount=1, **labels):
+    """
+    Adds to the counter of a metric name and label set
+    """
+    with _lock:
+        series=_counters.setdefault(name, {})
+        key=labelKey(labels)
+        series[key]=series.get(key, 0)+amount
+
+class StageTimer:
+    def __init__(self, stage):
+        self.stage=stage
+
+    def __enter__(self):
+        self.start=time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe('finance_stage_seconds', time.perf_counter()-self.start, stage=self.stage)
+        return False
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_nullTimer=NullTimer()
+
+def timer(stage):
+    """
+    Usage: with metrics.timer('simulation_loop'): ...
+    Input:
+        stage (String): Stage label of the finance_stage_seconds histogram
+    Output: Context manager timing its block while metrics are enabled
+    """
+    return StageTimer(stage) if enabled else _nullTimer
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+def formatLabels(key, extra=()):
+    labels=list(key)+list(extra)
+    if not labels:
+        return ''
+    return '{'+','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)+'}'
+
+def render():
+    """
+    Output: Every metric of this process in the Prometheus text exposition format
+    """
+    lines=[]
+    with _lock:
+        for name, series in sorted(_counters.items()):
+            lines.append('# HELP %s %s' % (name, _help.get(name, name)))
+            lines.append('# TYPE %s counter' % name)
+            for key, value in sorted(series.items()):
+                lines.append('%s%s %s' % (name, formatLabels(key), value))
+        for name, series in sorted(_histograms.items()):
+            lines.append('# HELP %s %s' % (name, _help.get(name, name)))
+            lines.append('# TYPE %s histogram' % name)
+            for key, histogram in sorted(series.items()):
+                cumulative=0
+                for bound, count in zip(list(buckets)+['+Inf'], histogram.counts):
+                    cumulative+=count
+                    lines.append('%s_bucket%s %d' % (name, formatLabels(key, [('le', bound)]), cumulative))
+                lines.append('%s_sum%s %r' % (name, formatLabels(key), histogram.sum))
+                lines.append('%s_count%s %d' % (name, formatLabels(key), histogram.count))
+    return '\n'.join(lines)+'\n'
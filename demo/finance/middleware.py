@@ -0,0 +1,48 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from finance import metrics
+
+class MetricsMiddleware:
+    """
+    Times every request and the rendering of template responses into the per-process finance metrics.
+    Does nothing beyond one flag check while FINANCE_METRICS is off. Supports both request paths,
+    so under ASGI async views are not pushed onto a thread by this middleware
+    """
+    sync_capable=True
+    async_capable=True
+
+    def __init__(self, get_response):
+        self.get_response=get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not metrics.enabled:
+            return self.get_response(request)
+        start=time.perf_counter()
+        response=self.get_response(request)
+        self.record(request, response, start)
+        return response
+
+    async def __acall__(self, request):
+        if not metrics.enabled:
+            return await self.get_response(request)
+        start=time.perf_counter()
+        response=await self.get_response(request)
+        self.record(request, response, start)
+        return response
+
+    def record(self, request, response, start):
+        match=getattr(request, 'resolver_match', None)
+        view=match.view_name if match is not None else 'unresolved'
+        metrics.observe('finance_request_seconds', time.perf_counter()-start, view=view)
+        metrics.increment('finance_requests_total', view=view, method=request.method, status=response.status_code)
+
+    def process_template_response(self, request, response):
+        #Runs right before the response is rendered, the callback right after
+        if metrics.enabled:
+            start=time.perf_counter()
+            response.add_post_render_callback(lambda r: metrics.observe('finance_stage_seconds', time.perf_counter()-start, stage='template_render'))
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 2.2 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0004_auto_20190723_0956'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='financialinfo',
+            name='fwb_score',
+            field=models.FloatField(blank=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2 on 2026-10-18 09:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0005_financialinfo_fwb_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimulationJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_index=True, max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('diagnosis', models.TextField(blank=True, default='')),
+                ('script', models.TextField(blank=True, default='')),
+                ('div', models.TextField(blank=True, default='')),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, default=None, null=True)),
+                ('financial_info', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='simulation_jobs', to='finance.FinancialInfo')),
+            ],
+        ),
+    ]
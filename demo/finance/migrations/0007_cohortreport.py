@@ -0,0 +1,26 @@
+# Generated by Django 2.2 on 2026-10-18 14:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0006_simulationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CohortReport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_at', models.DateTimeField(db_index=True)),
+                ('required_return', models.FloatField()),
+                ('ruin_probability', models.FloatField()),
+                ('worst_case', models.FloatField()),
+                ('trials', models.PositiveIntegerField()),
+                ('financial_info', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cohort_reports', to='finance.FinancialInfo')),
+            ],
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0007_cohortreport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulationjob',
+            name='series',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0008_simulationjob_series'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulationjob',
+            name='pending_key',
+            field=models.CharField(blank=True, default=None, max_length=255, null=True, unique=True),
+        ),
+    ]
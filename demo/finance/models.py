@@ -37,8 +37,57 @@ class FinancialInfo(models.Model):
     FWB2_1=models.CharField(max_length=300, choices=FWB2_1_choices, default='Refused')
     FWB2_3=models.CharField(max_length=300, choices=FWB2_3_choices, default='Refused')
 
+    #Financial wellbeing score stored by the score_fwb bulk scoring command
+    fwb_score=models.FloatField(null=True, blank=True, default=None)
+
     def __str__(self):
         return self.user.username
     def save(self, *args, **kwargs):
         self.slug=slugify(self.user.username)
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class SimulationJob(models.Model):
+    """
+    Background Monte Carlo simulation run, polled by the simulation page until it finishes
+    """
+    PENDING='pending'
+    DONE='done'
+    FAILED='failed'
+    status_choices=[(PENDING, 'Pending'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    financial_info=models.ForeignKey(FinancialInfo, on_delete=models.CASCADE, related_name='simulation_jobs')
+    #Hash of the simulation inputs, identical pending requests share one job
+    key=models.CharField(max_length=255, db_index=True)
+    #The key while the job is pending, cleared when it finishes. Being unique, concurrent identical requests
+    #cannot both create a pending job
+    pending_key=models.CharField(max_length=255, unique=True, null=True, blank=True, default=None)
+    status=models.CharField(max_length=10, choices=status_choices, default=PENDING)
+    diagnosis=models.TextField(blank=True, default='')
+    script=models.TextField(blank=True, default='')
+    div=models.TextField(blank=True, default='')
+    #JSON chart series of jobs run for the simulation data endpoint, instead of the Bokeh script and div
+    series=models.TextField(blank=True, default='')
+    error=models.TextField(blank=True, default='')
+    created_at=models.DateTimeField(auto_now_add=True)
+    finished_at=models.DateTimeField(null=True, blank=True, default=None)
+
+    def __str__(self):
+        return '%s (%s)' % (self.key, self.status)
+
+
+class CohortReport(models.Model):
+    """
+    One user's line of a nightly cohort risk report, written in bulk by the cohort_report command
+    """
+    financial_info=models.ForeignKey(FinancialInfo, on_delete=models.CASCADE, related_name='cohort_reports')
+    #Shared by every row of the same run
+    run_at=models.DateTimeField(db_index=True)
+    required_return=models.FloatField()
+    ruin_probability=models.FloatField()
+    #5th percentile of the simulated terminal wealth
+    worst_case=models.FloatField()
+    trials=models.PositiveIntegerField()
+
+    def __str__(self):
+        return '%s (%s)' % (self.financial_info_id, self.run_at)
@@ -0,0 +1,70 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from finance.sketch import QuantileSketch
+
+_pools={}
+_poolLock=threading.Lock()
+
+def getPool(workers):
+    """
+    Output: Process pool with the given worker count, created once per process and reused across requests
+    """
+    with _poolLock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+    return _pools[workers]
+
+def shutdownPools():
+    """
+    Shuts down the process pools of this process without waiting for their running shards
+    """
+    with _poolLock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def shardSizes(trials, shardSize):
+    """
+    Output: List of trial counts per shard, which depends only on the trial count and never on the worker count
+    """
+    sizes = [shardSize]*(trials//shardSize)
+    if trials % shardSize:
+        sizes.append(trials % shardSize)
+    return sizes
+
+def simulateShard(lifetimeIncome, lifetimeSpending, userSavings, assetReturn, assetRisk, trials, seedSequence):
+    """
+    Runs one shard of trials with its own random stream and returns a compact sketch instead of the full paths
+    """
+    from finance.health_check import simulateSavings
+    rng = np.random.default_rng(seedSequence)
+    yearlyInvestmentResult = rng.normal(assetReturn, assetRisk, size=(len(lifetimeIncome), trials))
+    return QuantileSketch.fromPaths(simulateSavings(lifetimeIncome, lifetimeSpending, userSavings, yearlyInvestmentResult))
+
+def parallelSimulation(lifetimeIncome, lifetimeSpending, userSavings, assetReturn, assetRisk, trials, seed=None, workers=1, shardSize=2500):
+    """
+    Splits the trials into shards seeded by numpy.random.SeedSequence.spawn and runs them across a process pool
+    Input:
+        lifetimeIncome (List): Extrapolated yearly income until death age
+        lifetimeSpending (List): Extrapolated yearly spending until death age
+        userSavings (Int): Current savings level
+        assetReturn (Float): Expected yearly return
+        assetRisk (Float): Yearly return standard deviation
+        trials (Int): Total number of simulation trials
+        seed (Int): Root seed, results are identical for every worker count
+        workers (Int): Number of worker processes, 1 runs the shards in this process
+        shardSize (Int): Trials per shard
+    Output: QuantileSketch merged over all shards
+    """
+    sizes = shardSizes(trials, shardSize)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    lifetimeIncome = np.asarray(lifetimeIncome, dtype=np.float64)
+    lifetimeSpending = np.asarray(lifetimeSpending, dtype=np.float64)
+    tasks = [(lifetimeIncome, lifetimeSpending, userSavings, assetReturn, assetRisk, n, s) for n, s in zip(sizes, seeds)]
+    if workers > 1 and len(tasks) > 1:
+        sketches = list(getPool(workers).map(simulateShard, *zip(*tasks)))
+    else:
+        sketches = [simulateShard(*task) for task in tasks]
+    return QuantileSketch.merge(sketches)
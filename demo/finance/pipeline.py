@@ -0,0 +1,49 @@
+from finance.prediction import encoding_order
+
+class Stage:
+    """
+    One step of the analysis pipeline and the FinancialInfo fields it reads directly
+    Input:
+        name (String): Stage name
+        fields (List): Model fields read by the stage itself
+        depends (List): Names of the upstream stages whose outputs it consumes
+    """
+    def __init__(self, name, fields, depends=()):
+        self.name=name
+        self.fields=list(fields)
+        self.depends=list(depends)
+
+#Array stages are memoized in-process on their field values (cashflow.incomeSchedule, cashflow.spendingSchedule,
+#scenarios.seededShocks), result stages are stored in the finance cache under a hash of all their upstream fields
+STAGES={stage.name:stage for stage in [
+    Stage('income_schedule', ['income', 'income_growth', 'current_age', 'death_age', 'retirement_age']),
+    Stage('spending_schedule', ['spending', 'inflation', 'current_age', 'death_age']),
+    Stage('return_draws', ['current_age', 'death_age']),
+    Stage('req_return', ['savings'], depends=['income_schedule', 'spending_schedule']),
+    Stage('simulation', ['savings', 'investment_risk'], depends=['income_schedule', 'spending_schedule', 'return_draws']),
+    Stage('prediction', encoding_order),
+]}
+
+#Stage owning the cached results of each kind, sweeps are keyed 'sweep:<grid hash>'
+KIND_STAGES={'req_return':'req_return', 'simulation':'simulation', 'simulation_data':'simulation', 'sweep':'simulation', 'prediction':'prediction'}
+
+def stage_fields(name):
+    """
+    Output: Every model field a stage depends on, directly or through its upstream stages, in declaration order
+    """
+    fields=[]
+    for upstream in STAGES[name].depends:
+        fields+=[f for f in stage_fields(upstream) if f not in fields]
+    return fields+[f for f in STAGES[name].fields if f not in fields]
+
+def affected_stages(changed_fields):
+    """
+    Input:
+        changed_fields (List): Names of the model fields that changed, for example form.changed_data
+    Output: Set of stage names whose output may differ, including everything downstream of them
+    """
+    changed=set(changed_fields)
+    return {name for name in STAGES if changed.intersection(stage_fields(name))}
+
+def kind_stage(kind):
+    return KIND_STAGES[kind.split(':')[0]]
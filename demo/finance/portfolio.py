@@ -0,0 +1,167 @@
+import threading
+import numpy as np
+
+#Default asset classes with their expected yearly return, yearly standard deviation and correlation
+assetNames = ['stocks', 'bonds', 'cash']
+assetMeans = np.array([0.07, 0.03, 0.01])
+assetRisks = np.array([0.16, 0.06, 0.01])
+assetCorrelation = np.array([[1.0, 0.2, 0.0],
+                             [0.2, 1.0, 0.1],
+                             [0.0, 0.1, 1.0]])
+
+def riskAllocation(investmentRisk):
+    """
+    Maps the user selected investment riskiness ranking to a starting allocation over the default asset classes
+    Input:
+        investmentRisk (Int): User selected investment riskiness ranking
+    Output: Array of asset weights summing to one, in the order of assetNames
+    """
+    if investmentRisk < 2:
+        return np.array([0.0, 0.1, 0.9])
+    elif investmentRisk < 4:
+        return np.array([0.2, 0.6, 0.2])
+    elif investmentRisk < 6:
+        return np.array([0.4, 0.5, 0.1])
+    elif investmentRisk < 8:
+        return np.array([0.7, 0.3, 0.0])
+    else:
+        return np.array([1.0, 0.0, 0.0])
+
+def glidePath(startAllocation, endAllocation, userCurrentAge, userRetirementAge, userDeathAge):
+    """
+    Allocation moving linearly from the starting weights to the ending weights until retirement, then held
+    Input:
+        startAllocation (Array): Asset weights at the current age
+        endAllocation (Array): Asset weights from retirement onwards
+        userCurrentAge (Int): User current age
+        userRetirementAge (Int): User retirement age
+        userDeathAge (Int): User expected mortality age, used to calculate life expectancy
+    Output: Array of asset weights shaped (years, assets)
+    """
+    ages = np.arange(userCurrentAge, userDeathAge)
+    span = max(userRetirementAge-userCurrentAge, 1)
+    progress = np.clip((ages-userCurrentAge)/span, 0, 1)[:, None]
+    return (1-progress)*np.asarray(startAllocation, dtype=np.float64) + progress*np.asarray(endAllocation, dtype=np.float64)
+
+def riskGlidePath(investmentRisk, userCurrentAge, userRetirementAge, userDeathAge):
+    """
+    Default glide path of a riskiness ranking: half of the stock weight moves into bonds by retirement
+    Output: Array of asset weights shaped (years, assets)
+    """
+    start = riskAllocation(investmentRisk)
+    end = start.copy()
+    end[0] = start[0]/2
+    end[1] = start[1] + start[0]/2
+    return glidePath(start, end, userCurrentAge, userRetirementAge, userDeathAge)
+
+class PortfolioModel:
+    """
+    Multi-asset return model drawing trials x years x assets at once into per-thread buffers reused across batches
+    Input:
+        means (Array): Expected yearly return per asset
+        covariance (Array): Covariance matrix of the yearly returns, correlated through its Cholesky factor
+        distribution (String): 'normal', 't' for Student-t shocks scaled to the same covariance, or
+            'bootstrap' to resample whole years of history, which keeps their correlation and tails
+        degreesOfFreedom (Float): Student-t degrees of freedom, must be above 2
+        history (Array): Yearly asset returns shaped (observations, assets), required for 'bootstrap'
+    """
+    def __init__(self, means, covariance, distribution='normal', degreesOfFreedom=5, history=None):
+        if distribution not in ('normal', 't', 'bootstrap'):
+            raise ValueError("distribution must be 'normal', 't' or 'bootstrap'")
+        if distribution == 't' and degreesOfFreedom <= 2:
+            raise ValueError('Student-t returns need more than 2 degrees of freedom to have a variance')
+        if distribution == 'bootstrap' and history is None:
+            raise ValueError('Bootstrap returns need a history of yearly returns')
+        self.means = np.asarray(means, dtype=np.float64)
+        self.covariance = np.asarray(covariance, dtype=np.float64)
+        #Resampled years already carry their correlation, only the parametric models need the factor
+        self.cholesky = None if distribution == 'bootstrap' else np.linalg.cholesky(self.covariance)
+        self.distribution = distribution
+        self.degreesOfFreedom = degreesOfFreedom
+        self.history = None if history is None else np.ascontiguousarray(history, dtype=np.float64)
+        self._local = threading.local()
+
+    @classmethod
+    def default(cls, distribution='normal', **kwargs):
+        """
+        Output: Model of the default asset classes
+        """
+        covariance = assetCorrelation*np.outer(assetRisks, assetRisks)
+        return cls(assetMeans, covariance, distribution=distribution, **kwargs)
+
+    @classmethod
+    def fromHistory(cls, history):
+        """
+        Input:
+            history (Array): Yearly asset returns shaped (observations, assets)
+        Output: Bootstrap model resampling the history, its means and covariance are the sample moments
+        """
+        history = np.asarray(history, dtype=np.float64)
+        return cls(history.mean(axis=0), np.cov(history, rowvar=False), distribution='bootstrap', history=history)
+
+    def __getstate__(self):
+        #Buffers are scratch space of this process, a pickled model starts without them
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def assets(self):
+        return len(self.means)
+
+    def buffers(self, years, trials):
+        #One set of arrays per thread for the latest batch shape, batches of the same size overwrite them instead of allocating
+        key = (years, trials)
+        if getattr(self._local, 'key', None) != key:
+            self._local.key = key
+            self._local.buffers = {'shocks':np.empty((years, trials, self.assets)),
+                                   'returns':np.empty((years, trials, self.assets)),
+                                   'scale':np.empty((years, trials)),
+                                   'portfolio':np.empty((years, trials))}
+        return self._local.buffers
+
+    def assetReturns(self, years, trials, rng):
+        """
+        Input:
+            years (Int): Number of simulated years
+            trials (Int): Number of simulation trials
+            rng (numpy.random.Generator): Random generator used for the draws
+        Output: Array of yearly asset returns shaped (years, trials, assets). It is a reused buffer,
+            overwritten by the next draw of this thread
+        """
+        buffers = self.buffers(years, trials)
+        returns = buffers['returns']
+        if self.distribution == 'bootstrap':
+            indices = rng.integers(0, len(self.history), size=(years, trials))
+            np.take(self.history, indices, axis=0, out=returns)
+            return returns
+        shocks = buffers['shocks']
+        rng.standard_normal(out=shocks)
+        if self.distribution == 't':
+            #Multivariate t: one chi-square mixing draw per trial-year shared by every asset, rescaled to unit variance
+            scale = buffers['scale']
+            rng.standard_gamma(self.degreesOfFreedom/2, out=scale)
+            np.divide((self.degreesOfFreedom-2)/2, scale, out=scale)
+            np.sqrt(scale, out=scale)
+            shocks *= scale[:, :, None]
+        np.matmul(shocks, self.cholesky.T, out=returns)
+        returns += self.means
+        return returns
+
+    def portfolioReturns(self, weights, trials, rng):
+        """
+        Input:
+            weights (Array): Asset weights shaped (years, assets), for example a glide path
+            trials (Int): Number of simulation trials
+            rng (numpy.random.Generator): Random generator used for the draws
+        Output: Array of yearly portfolio returns shaped (years, trials), a reused buffer like assetReturns
+        """
+        years = len(weights)
+        returns = self.assetReturns(years, trials, rng)
+        portfolio = self.buffers(years, trials)['portfolio']
+        np.einsum('yta,ya->yt', returns, weights, out=portfolio)
+        return portfolio
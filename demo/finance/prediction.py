@@ -1,5 +1,9 @@
 from demo.settings import BASE_DIR
+import hashlib
 import os
+import threading
+import time
+from finance import metrics
 path=os.path.join(BASE_DIR, 'finance','static','prediction')
 
 encoding_order=['FWB2_1', 'FWB1_3', 'FWB2_3', 'FWB1_6', 'FWB1_5']
@@ -9,12 +13,79 @@ predictor_description = {'FWB1_3':'Because of my money situation...I will never
      'FWB2_1':'Giving a gift...would put a strain on my finances for the month',
      'FWB2_3':'I am behind with my finances'}
 
-def make_prediction(selection_dict, encoding_order):
+class ModelRegistry:
+     """
+     Keeps the FWB encoder and model in memory once per process
+     The files are unpickled lazily on first use and reloaded when their mtime changes and their content hash differs
+     """
+     model_files=('fwb_encoder', 'fwb_model')
+
+     def __init__(self, directory=path):
+          self.directory=directory
+          self.models={}
+          self.signature=None
+          self.version=None
+          self.load_time=None
+          self.loaded_at=None
+          self.lock=threading.Lock()
+
+     def file_signature(self):
+          #Cheap stat based check done on every access
+          return tuple(os.stat(os.path.join(self.directory, f)).st_mtime_ns for f in self.model_files)
+
+     def file_hash(self):
+          digest=hashlib.sha256()
+          for f in self.model_files:
+               with open(os.path.join(self.directory, f), 'rb') as model_file:
+                    digest.update(model_file.read())
+          return digest.hexdigest()[:12]
+
+     def load(self):
+          """
+          Unpickles the model files unless the loaded version already matches their content hash
+          Output: Dictionary of loaded models keyed by file name
+          """
+          import joblib
+          with self.lock:
+               signature=self.file_signature()
+               version=self.file_hash()
+               if version!=self.version or not self.models:
+                    start=time.perf_counter()
+                    self.models={f:joblib.load(os.path.join(self.directory, f)) for f in self.model_files}
+                    self.load_time=time.perf_counter()-start
+                    self.loaded_at=time.time()
+                    self.version=version
+               self.signature=signature
+          return self.models
+
+     def get(self):
+          """
+          Output: Tuple of (encoder, model), loading them first if the files changed since the last load
+          """
+          models=self.models
+          if self.signature!=self.file_signature():
+               models=self.load()
+          return models['fwb_encoder'], models['fwb_model']
+
+registry=ModelRegistry()
+
+def make_predictions(rows, encoding_order, model_registry=None):
+     """
+     Batch prediction: one encoder transform and one model predict call over an N x 5 matrix of survey answers
+     Input:
+          rows (List): Dictionaries of survey answers keyed by field name
+          encoding_order (List): Field order expected by the encoder
+          model_registry (ModelRegistry): Registry holding the models, the module registry by default
+     Output: Array of predicted financial wellbeing scores, one per row
+     """
      import numpy as np
-     import joblib
-     encoder=joblib.load(os.path.join(path,'fwb_encoder'))
-     fwb_model=joblib.load(os.path.join(path,'fwb_model'))
-     input_data=np.array([selection_dict[p] for p in encoding_order]).reshape(1,-1)
-     input_data=encoder.transform(input_data)
-     pred=fwb_model.predict(input_data)[0]
-     return pred
+     with metrics.timer('model_load'):
+          encoder, fwb_model=(model_registry or registry).get()
+     with metrics.timer('encode'):
+          input_data=np.array([[row[p] for p in encoding_order] for row in rows]).reshape(-1, len(encoding_order))
+          input_data=encoder.transform(input_data)
+     with metrics.timer('predict'):
+          return fwb_model.predict(input_data)
+
+def make_prediction(selection_dict, encoding_order, model_registry=None):
+     return make_predictions([selection_dict], encoding_order, model_registry)[0]
@@ -0,0 +1,108 @@
+import math
+import numpy as np
+from statistics import NormalDist
+from finance.cashflow import incomeSchedule, spendingSchedule
+
+_normal = NormalDist()
+
+def wealthMoments(netCashFlow, userSavings, assetReturn, assetRisk):
+    """
+    Exact yearly mean, variance and third central moment of wealth under independent normal yearly returns,
+    from the recursion W' = W*G + cashflow with G independent of W. Unlike the Monte Carlo engine, negative
+    balances compound too
+    Input:
+        netCashFlow (List): Yearly income minus spending until death age
+        userSavings (Int): Current savings level
+        assetReturn (Float): Expected yearly return
+        assetRisk (Float): Yearly return standard deviation
+    Output: List of (mean, variance, third central moment) per year
+    """
+    g1 = 1+assetReturn
+    g2 = g1*g1 + assetRisk*assetRisk
+    g3 = g1**3 + 3*g1*assetRisk*assetRisk
+    m1, m2, m3 = float(userSavings), float(userSavings)**2, float(userSavings)**3
+    moments = []
+    for c in netCashFlow:
+        c = float(c)
+        m1, m2, m3 = (m1*g1 + c,
+                      m2*g2 + 2*c*g1*m1 + c*c,
+                      m3*g3 + 3*c*g2*m2 + 3*c*c*g1*m1 + c**3)
+        variance = max(m2 - m1*m1, 0.0)
+        moments.append((m1, variance, m3 - 3*m1*variance - m1**3))
+    return moments
+
+def momentPercentiles(mean, variance, third, q):
+    """
+    Approximate percentiles from the first three moments with a three-parameter (shifted) lognormal,
+    mirrored for negative skew and falling back to a normal when the skew is negligible
+    Input:
+        mean, variance, third (Array): Moments, one entry per year
+        q (Float): Percentile between 0 and 100
+    Output: Array of the q-th percentile per year
+    """
+    mean, variance, third = (np.asarray(a, dtype=np.float64) for a in (mean, variance, third))
+    sd = np.sqrt(variance)
+    z = _normal.inv_cdf(min(max(q/100, 1e-9), 1-1e-9))
+    result = mean + sd*z
+    skew = np.divide(third, sd**3, out=np.zeros_like(mean), where=sd > 0)
+    fit = np.abs(skew) > 1e-6
+    if fit.any():
+        g = np.abs(skew[fit])
+        root = np.sqrt(1 + g*g/4)
+        w = np.cbrt(1 + g*g/2 + g*root) + np.cbrt(1 + g*g/2 - g*root) - 1
+        sigma = np.sqrt(np.log(w))
+        scale = sd[fit]/np.sqrt(w*(w-1))#exp of the log mean
+        sign = np.sign(skew[fit])
+        #Mirroring for negative skew turns the q-th percentile into the (100-q)-th of the mirrored lognormal
+        result[fit] = mean[fit] + sign*scale*(np.exp(sigma*sign*z) - np.sqrt(w))
+    return result
+
+def momentBelowZero(mean, variance, third):
+    """
+    Output: Approximate probability (%) of a value below zero given its first three moments, same fit as momentPercentiles
+    """
+    if variance <= 0:
+        return 100.0 if mean < 0 else 0.0
+    sd = math.sqrt(variance)
+    skew = third/sd**3
+    if abs(skew) <= 1e-6:
+        return 100*_normal.cdf(-mean/sd)
+    root = math.sqrt(1 + skew*skew/4)
+    #Both cube root arguments are positive, their product is one
+    w = (1 + skew*skew/2 + abs(skew)*root)**(1/3) + (1 + skew*skew/2 - abs(skew)*root)**(1/3) - 1
+    sigma = math.sqrt(math.log(w))
+    scale = sd/math.sqrt(w*(w-1))
+    sign = 1 if skew > 0 else -1
+    #Distance of zero from the shift, in units of the (mirrored) lognormal
+    x = sign*(0-mean)/scale + math.sqrt(w)
+    if x <= 0:
+        return 100.0 if sign < 0 else 0.0
+    below = _normal.cdf(math.log(x)/sigma)
+    return 100*(below if sign > 0 else 1-below)
+
+def previewSummary(userIncome, incomeGrowth, userSpending, inflation, userSavings, investmentRisk, userCurrentAge, userDeathAge, userRetirementAge):
+    """
+    Analytic preview of simHealthSummary: moment matched yearly wealth distribution, no random draws
+    Input: User financial information
+    Output: Dictionary of the yearly 5th, 25th and 50th percentile wealth and the ruin probability (%)
+    """
+    from finance.health_check import riskReturnProfile
+    assetReturn, assetRisk = riskReturnProfile(investmentRisk)
+    lifetimeIncome = incomeSchedule(userIncome, incomeGrowth, userCurrentAge, userDeathAge, userRetirementAge)
+    lifetimeSpending = spendingSchedule(userSpending, inflation, userCurrentAge, userDeathAge)
+    moments = wealthMoments(lifetimeIncome-lifetimeSpending, userSavings, assetReturn, assetRisk)
+    mean, variance, third = np.array(moments).T
+    series = {name:momentPercentiles(mean, variance, third, q) for name, q in [('worst_case', 5), ('poor_case', 25), ('average_case', 50)]}
+    series['ruin_probability'] = momentBelowZero(*moments[-1])
+    return series
+
+def previewSeries(*args):
+    """
+    Rough median wealth path shown while the Monte Carlo health check has not run, in microseconds rather than milliseconds.
+    Because negative balances compound here, the tails and the ruin probability can be far from the simulation,
+    and even the median drifts once it turns negative, so no diagnosis is derived from it
+    Input: User financial information, see previewSummary
+    Output: Chart data in the format of simSeries, holding only the median
+    """
+    summary = previewSummary(*args)
+    return {'average_case':np.round(summary['average_case'], 2).tolist()}
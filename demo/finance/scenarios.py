@@ -0,0 +1,89 @@
+import hashlib
+import os
+from functools import lru_cache
+import numpy as np
+
+def buildBank(path, years=100, trials=20000, seed=0):
+    """
+    Generates a scenario bank of standardized return shocks and saves it as a .npy file
+    Input:
+        path (String): Destination file, written atomically so running workers never map a partial file
+        years (Int): Longest planning horizon the bank covers
+        trials (Int): Scenarios per year, the most trials one simulation can use
+        seed (Int): Seed of the shocks, the same seed always builds the same bank
+    Output: Short digest of the bank content
+    """
+    shocks = np.random.default_rng(seed).standard_normal((years, trials))
+    temporary = path + '.tmp.npy'
+    np.save(temporary, shocks)
+    os.replace(temporary, path)
+    return bankDigest(shocks)
+
+def bankDigest(bank):
+    return hashlib.sha256(np.ascontiguousarray(bank).tobytes()).hexdigest()[:12]
+
+@lru_cache(maxsize=4)
+def loadBank(path, mtime_ns=None):
+    """
+    Memory-maps a scenario bank read-only. Every process mapping the file shares one copy in the page cache
+    Input:
+        path (String): Bank file written by buildBank
+        mtime_ns (Int): Modification time of the file, part of the memo key so a rebuilt bank is mapped again
+    Output: Read-only array of standardized shocks shaped (years, trials)
+    """
+    return np.load(path, mmap_mode='r')
+
+def openBank(path):
+    return loadBank(path, os.stat(path).st_mtime_ns)
+
+@lru_cache(maxsize=4)
+def loadBankDigest(path, mtime_ns=None):
+    """
+    Output: Digest of a bank file's content, hashed once per process and file version
+    """
+    return bankDigest(loadBank(path, mtime_ns))
+
+def openBankDigest(path):
+    return loadBankDigest(path, os.stat(path).st_mtime_ns)
+
+@lru_cache(maxsize=16)
+def seededShocks(years, trials, seed):
+    """
+    Return draws stage: standardized shocks of one seed, drawn once per process and shared by every
+    simulation with the same horizon and seed, whatever the cash flows and risk level
+    Output: Read-only array of shocks shaped (years, trials)
+    """
+    shocks = np.random.default_rng(seed).standard_normal((years, trials))
+    shocks.setflags(write=False)
+    return shocks
+
+def bankReturns(bank, assetReturn, assetRisk, years, trials, start=0):
+    """
+    Scales and shifts a window of the bank into yearly returns, no random numbers are drawn
+    Input:
+        bank (Array): Standardized shocks shaped (bankYears, bankTrials)
+        assetReturn (Float): Expected yearly return
+        assetRisk (Float): Yearly return standard deviation
+        years (Int): Number of simulated years
+        trials (Int): Number of simulation trials
+        start (Int): First scenario of the window
+    Output: Array of yearly returns shaped (years, trials)
+    """
+    if years > bank.shape[0] or start+trials > bank.shape[1]:
+        raise ValueError('The scenario bank holds %d years x %d scenarios, %d years x %d scenarios from %d were requested'
+                         % (bank.shape[0], bank.shape[1], years, trials, start))
+    yearlyInvestmentResult = np.multiply(bank[:years, start:start+trials], assetRisk)
+    yearlyInvestmentResult += assetReturn
+    return yearlyInvestmentResult
+
+def bankDraws(bank, assetReturn, assetRisk, years):
+    """
+    Output: drawReturns(trials, rng) function for simSummary reading consecutive windows of the bank,
+        so the n-th trial of every simulation uses the same scenario. The rng argument is ignored
+    """
+    cursor = [0]
+    def drawReturns(trials, rng):
+        yearlyInvestmentResult = bankReturns(bank, assetReturn, assetRisk, years, trials, start=cursor[0])
+        cursor[0] += trials
+        return yearlyInvestmentResult
+    return drawReturns
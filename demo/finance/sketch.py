@@ -0,0 +1,67 @@
+import numpy as np
+
+#Quantile levels kept by a compacted sketch, 0.5% apart
+sketchLevels = np.linspace(0, 1, 201)
+
+class QuantileSketch:
+    """
+    Mergeable summary of simulated yearly savings: a weighted set of points per year plus exact terminal ruin counts
+    Partial results of separate simulation shards or batches are merged without keeping every trial
+    """
+    def __init__(self, points, weights, below, atOrBelow, count):
+        self.points = points#(years, m) sorted along each row
+        self.weights = weights#(years, m) trial weight carried by every point
+        self.below = below#Trials ending with negative savings
+        self.atOrBelow = atOrBelow#Trials ending with savings of zero or less
+        self.count = count
+
+    @classmethod
+    def fromPaths(cls, yearlyDetails, levels=sketchLevels):
+        """
+        Summarizes a (years, trials) savings matrix, keeping the trials themselves when there are fewer of them than levels
+        """
+        years, trials = yearlyDetails.shape
+        if trials <= len(levels):
+            points = np.sort(yearlyDetails, axis=1)
+            weights = np.ones((years, trials))
+        else:
+            points = np.quantile(yearlyDetails, levels, axis=1).T
+            weights = np.full((years, len(levels)), trials/len(levels))
+        terminal = yearlyDetails[-1]
+        return cls(points, weights, int(np.count_nonzero(terminal < 0)), int(np.count_nonzero(terminal <= 0)), trials)
+
+    @classmethod
+    def merge(cls, sketches, levels=sketchLevels):
+        """
+        Combines sketches of disjoint trials, compacting the result back to the given quantile levels
+        """
+        points = np.hstack([s.points for s in sketches])
+        weights = np.hstack([s.weights for s in sketches])
+        order = np.argsort(points, axis=1)
+        merged = cls(np.take_along_axis(points, order, axis=1), np.take_along_axis(weights, order, axis=1),
+                     sum(s.below for s in sketches), sum(s.atOrBelow for s in sketches), sum(s.count for s in sketches))
+        if points.shape[1] > len(levels):
+            merged.points = merged.percentile(levels*100).T
+            merged.weights = np.full(merged.points.shape, merged.count/len(levels))
+        return merged
+
+    def percentile(self, q):
+        """
+        Weighted linear interpolation percentile, equal to np.percentile when every point is a single trial
+        Input:
+            q (Float or List): Percentile(s) between 0 and 100
+        Output: Array of percentiles shaped (len(q), years), or (years,) for a scalar q
+        """
+        q = np.asarray(q, dtype=np.float64)/100
+        cumulative = np.cumsum(self.weights, axis=1) - self.weights
+        span = cumulative[:, -1:]
+        positions = np.divide(cumulative, span, out=np.zeros_like(cumulative), where=span > 0)
+        result = np.array([np.interp(q, positions[j], self.points[j]) for j in range(len(self.points))])
+        return result.T
+
+    def ruinProbability(self):
+        """
+        Output: Percentile rank of zero terminal savings, as computed by scipy.stats.percentileofscore
+        """
+        plus1 = self.below < self.atOrBelow
+        return (self.below + self.atOrBelow + plus1) * (50.0/self.count)
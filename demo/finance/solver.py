@@ -0,0 +1,104 @@
+import numpy as np
+from finance.cashflow import incomeSchedule, spendingSchedule
+
+minReqReturn = 0
+maxReqReturn = 0.2#20% is a very high return requirement
+
+def terminalWealth(reqReturns, lifetimeIncome, lifetimeSpending, userSavings):
+    """
+    Vectorized terminal wealth function: evaluates a whole array of candidate returns in one pass over the planning horizon
+    Input:
+        reqReturns (Float or Array): Candidate yearly returns
+        lifetimeIncome (List): Extrapolated yearly income until death age
+        lifetimeSpending (List): Extrapolated yearly spending until death age
+        userSavings (Int): Current savings level
+    Output: Array of savings left at death age for every candidate return. Negative balances earn no return
+    """
+    netCashFlow = np.asarray(lifetimeIncome, dtype=np.float64) - np.asarray(lifetimeSpending, dtype=np.float64)
+    return netTerminalWealth(reqReturns, netCashFlow, userSavings)
+
+def netTerminalWealth(reqReturns, netCashFlow, userSavings):
+    """
+    Terminal wealth function on a precomputed yearly net cash flow (income minus spending) array
+    """
+    growth = 1 + np.atleast_1d(np.asarray(reqReturns, dtype=np.float64))
+    savings = np.full(growth.shape, float(userSavings))
+    for j in range(len(netCashFlow)):
+        np.multiply(savings, growth, out=savings, where=savings >= 0)
+        savings += netCashFlow[j]
+    return savings
+
+def solveReqReturn(lifetimeIncome, lifetimeSpending, userSavings, gridSize=21, relativeTolerance=1e-6):
+    """
+    Required return solver: scans a grid of candidate returns at once, then refines the bracketing interval with Brent's method
+    Input:
+        lifetimeIncome (List): Extrapolated yearly income until death age
+        lifetimeSpending (List): Extrapolated yearly spending until death age
+        userSavings (Int): Current savings level
+        gridSize (Int): Number of candidate returns evaluated in the vectorized scan
+        relativeTolerance (Float): Allowed terminal wealth error as a fraction of the income and spending scale
+    Output: Tuple of (required return, solver statistics dictionary with iterations and function evaluations)
+    """
+    netCashFlow = np.asarray(lifetimeIncome, dtype=np.float64) - np.asarray(lifetimeSpending, dtype=np.float64)
+    grid = np.linspace(minReqReturn, maxReqReturn, gridSize)
+    wealth = netTerminalWealth(grid, netCashFlow, userSavings)
+    stats = {'grid_size': gridSize, 'iterations': 0, 'function_calls': gridSize, 'converged': True}
+    #Terminal wealth never decreases with the return, so the first non-negative grid point brackets the root
+    solvable = np.flatnonzero(wealth >= 0)
+    if len(solvable) == 0:#No solution under 20%, report the cap
+        stats['converged'] = False
+        return (maxReqReturn, stats)
+    k = solvable[0]
+    if k == 0 or wealth[k] == 0:
+        return (float(grid[k]), stats)
+    #Translate the wealth tolerance into a return tolerance using the local slope of the bracket
+    scale = max(np.max(np.abs(lifetimeIncome)), np.max(np.abs(lifetimeSpending)), 1)
+    slope = (wealth[k] - wealth[k-1]) / (grid[k] - grid[k-1])
+    xtol = max(relativeTolerance * scale / slope, 1e-12)
+    from scipy.optimize import brentq#Only needed once a bracket is found
+    f = lambda r: netTerminalWealth(r, netCashFlow, userSavings)[0]
+    reqReturn, result = brentq(f, grid[k-1], grid[k], xtol=xtol, full_output=True)
+    stats['iterations'] = result.iterations
+    stats['function_calls'] += result.function_calls
+    stats['converged'] = result.converged
+    return (reqReturn, stats)
+
+def solveReqReturns(netCashFlows, userSavings, iterations=40):
+    """
+    Batched required return solver: bisects every row at once, each step costs one pass over the horizon for all rows
+    Input:
+        netCashFlows (Array): Yearly net cash flows (income minus spending) shaped (rows, years)
+        userSavings (Int or Array): Current savings level, one per row or shared
+        iterations (Int): Bisection steps, 40 narrows the 0-20% bracket below 1e-12
+    Output: Array of required returns per row, maxReqReturn where even that is not enough
+    """
+    netCashFlows = np.atleast_2d(np.asarray(netCashFlows, dtype=np.float64))
+    rows, years = netCashFlows.shape
+    startSavings = np.broadcast_to(np.asarray(userSavings, dtype=np.float64), (rows,))
+    def wealth(reqReturns):
+        savings = startSavings.copy()
+        growth = 1 + reqReturns
+        for j in range(years):
+            np.multiply(savings, growth, out=savings, where=savings >= 0)
+            savings += netCashFlows[:, j]
+        return savings >= 0
+    low = np.full(rows, float(minReqReturn))
+    high = np.full(rows, float(maxReqReturn))
+    free = wealth(low)
+    capped = ~wealth(high)
+    for _ in range(iterations):
+        mid = (low+high)/2
+        enough = wealth(mid)
+        high = np.where(enough, mid, high)
+        low = np.where(enough, low, mid)
+    return np.where(free, float(minReqReturn), np.where(capped, float(maxReqReturn), high))
+
+def solveUserReqReturn(userIncome, incomeGrowth, userSpending, inflation, userSavings, userCurrentAge, userDeathAge, userRetirementAge, **kwargs):
+    """
+    Required return solver entry point taking raw user financial information, shared by the request path and bulk scoring
+    Input: User financial information, plus optional solveReqReturn keyword arguments
+    Output: Tuple of (required return, solver statistics dictionary)
+    """
+    lifetimeIncome = incomeSchedule(userIncome, incomeGrowth, userCurrentAge, userDeathAge, userRetirementAge)
+    lifetimeSpending = spendingSchedule(userSpending, inflation, userCurrentAge, userDeathAge)
+    return solveReqReturn(lifetimeIncome, lifetimeSpending, userSavings, **kwargs)
@@ -0,0 +1,58 @@
+import os
+import re
+import subprocess
+import sys
+import time
+
+#Modules imported to serve requests: the URL configuration pulls in every view module
+DEFAULT_MODULES=['demo.urls']
+importtime_line=re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+def warm_up():
+    """
+    Imports the heavy numerical modules and runs each analysis once on a small input,
+    so the first real request of a fresh worker does not pay for them
+    """
+    from finance import health_check
+    health_check.simHealthCheckData(60000, 0.02, 45000, 0.02, 20000, 5, 30, 40, 35, trials=100, seed=0)
+    health_check.reqReturnHealthCheck(60000, 0.02, 45000, 0.02, 20000, 30, 40, 35)
+
+def parse_importtime(output):
+    """
+    Parses the report of python -X importtime
+    Output: List of dictionaries with module name, nesting depth, self and cumulative import time in seconds
+    """
+    entries=[]
+    for line in output.splitlines():
+        match=importtime_line.match(line)
+        if match:
+            entries.append({'module':match.group(4), 'depth':len(match.group(3))//2,
+                            'self_s':int(match.group(1))/1e6, 'cumulative_s':int(match.group(2))/1e6})
+    return entries
+
+def profile_startup(modules=DEFAULT_MODULES, warm=False, settings_module=None):
+    """
+    Starts a fresh interpreter that sets up Django and imports the given modules under python -X importtime
+    Input:
+        modules (List): Dotted module names to import after django.setup()
+        warm (Bool): Also run the warm_up hook
+        settings_module (String): Settings module, defaults to the current DJANGO_SETTINGS_MODULE
+    Output: Tuple of (per-module import entries, wall time of the whole startup in seconds). Raises RuntimeError
+        with the child's output when it fails or reports no imports
+    """
+    code=['import django', 'django.setup()']+['import '+m for m in modules]
+    if warm:
+        code.append('from finance.startup import warm_up; warm_up()')
+    env=dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module or os.environ.get('DJANGO_SETTINGS_MODULE', 'demo.settings'))
+    start=time.perf_counter()
+    process=subprocess.run([sys.executable, '-X', 'importtime', '-c', '; '.join(code)], env=env,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed=time.perf_counter()-start
+    entries=parse_importtime(process.stderr)
+    if process.returncode or not entries:
+        #Leave out the import time report, what remains is the traceback or warnings of the child
+        errors='\n'.join(line for line in process.stderr.splitlines() if not line.startswith('import time:')).strip()
+        output=process.stdout.strip()
+        raise RuntimeError('%s\nstderr: %s\nstdout: %s' % ('exit status %d' % process.returncode if process.returncode else 'no import time report',
+                                                             errors or '(empty)', output or '(empty)'))
+    return (entries, elapsed)
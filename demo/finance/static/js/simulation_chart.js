@@ -0,0 +1,114 @@
+//Draws the simulated wealth percentiles served by the simulation data endpoint as an SVG line chart
+(function () {
+    var plot = document.getElementById('plot');
+    var diagnosis = document.getElementById('diagnosis');
+    var width = 500, height = 500, margin = {top: 40, right: 20, bottom: 50, left: 90};
+    var lines = [
+        {key: 'worst_case', label: 'worst case', color: 'rgb(225,0,0)'},
+        {key: 'poor_case', label: 'poor case', color: 'rgb(150,30,30)'},
+        {key: 'average_case', label: 'average case', color: 'rgb(100,50,50)'}
+    ];
+
+    function svg(tag, attributes, text) {
+        var element = document.createElementNS('http://www.w3.org/2000/svg', tag);
+        for (var name in attributes) {
+            element.setAttribute(name, attributes[name]);
+        }
+        if (text !== undefined) {
+            element.textContent = text;
+        }
+        return element;
+    }
+
+    function draw(series) {
+        //The preview only carries the median
+        var shown = lines.filter(function (line) { return series[line.key]; });
+        var years = series[shown[0].key].length;
+        var values = [].concat.apply([], shown.map(function (line) { return series[line.key]; }));
+        var low = Math.min.apply(null, values), high = Math.max.apply(null, values);
+        if (low === high) {
+            high = low + 1;
+        }
+        var x = function (i) { return margin.left + i * (width - margin.left - margin.right) / Math.max(years - 1, 1); };
+        var y = function (v) { return height - margin.bottom - (v - low) * (height - margin.top - margin.bottom) / (high - low); };
+        var chart = svg('svg', {width: width, height: height, role: 'img'});
+        chart.appendChild(svg('text', {x: width / 2, y: 20, 'text-anchor': 'middle', 'font-weight': 'bold'}, 'Simulated Wealth Over Time'));
+        chart.appendChild(svg('line', {x1: margin.left, y1: height - margin.bottom, x2: width - margin.right, y2: height - margin.bottom, stroke: '#888'}));
+        chart.appendChild(svg('line', {x1: margin.left, y1: margin.top, x2: margin.left, y2: height - margin.bottom, stroke: '#888'}));
+        chart.appendChild(svg('text', {x: width / 2, y: height - 10, 'text-anchor': 'middle'}, 'Years from now'));
+        [low, (low + high) / 2, high].forEach(function (v) {
+            chart.appendChild(svg('text', {x: margin.left - 5, y: y(v) + 4, 'text-anchor': 'end', 'font-size': 11}, Math.round(v).toLocaleString()));
+        });
+        [0, years - 1].forEach(function (i) {
+            chart.appendChild(svg('text', {x: x(i), y: height - margin.bottom + 15, 'text-anchor': 'middle', 'font-size': 11}, i));
+        });
+        if (low < 0 && high > 0) {
+            chart.appendChild(svg('line', {x1: margin.left, y1: y(0), x2: width - margin.right, y2: y(0), stroke: '#ccc', 'stroke-dasharray': '4'}));
+        }
+        shown.forEach(function (line, n) {
+            var points = series[line.key].map(function (v, i) { return x(i) + ',' + y(v); }).join(' ');
+            var path = svg('polyline', {points: points, fill: 'none', stroke: line.color, 'stroke-width': 3});
+            path.appendChild(svg('title', {}, line.label));
+            chart.appendChild(path);
+            var legendY = height - margin.bottom - 60 + n * 18;
+            chart.appendChild(svg('line', {x1: width - 140, y1: legendY, x2: width - 120, y2: legendY, stroke: line.color, 'stroke-width': 3}));
+            chart.appendChild(svg('text', {x: width - 115, y: legendY + 4, 'font-size': 12}, line.label));
+        });
+        plot.appendChild(chart);
+    }
+
+    //The analytic preview is embedded in the page, the full simulation is fetched from the data endpoint
+    var embedded = document.getElementById('preview-data');
+    if (embedded) {
+        draw(JSON.parse(embedded.textContent).series);
+        return;
+    }
+    function show(data) {
+        diagnosis.textContent = data.diagnosis;
+        draw(data.series);
+    }
+
+    function fail() {
+        diagnosis.textContent = 'The simulation could not be loaded, please reload the page to try again.';
+    }
+
+    //Calls handle with the JSON body of url. A busy server (503) is asked again after its Retry-After,
+    //any other error status, a body that is not JSON or a network failure shows an error instead
+    function load(url, handle) {
+        fetch(url, {credentials: 'same-origin'})
+            .then(function (response) {
+                if (response.status === 503) {
+                    var seconds = parseInt(response.headers.get('Retry-After'), 10) || 5;
+                    diagnosis.textContent = 'The server is busy, retrying in ' + seconds + ' seconds...';
+                    setTimeout(function () { load(url, handle); }, seconds * 1000);
+                    return;
+                }
+                if (!response.ok) {
+                    throw new Error(response.status + ' ' + response.statusText);
+                }
+                return response.json().then(handle);
+            })
+            .catch(fail);
+    }
+
+    //A pending result is computed by a background job, poll it until it finishes
+    function poll(url) {
+        load(url, function (job) {
+            if (job.status === 'pending') {
+                setTimeout(function () { poll(url); }, 1000);
+            } else if (job.status === 'failed') {
+                diagnosis.textContent = job.error;
+            } else {
+                show(job);
+            }
+        });
+    }
+
+    load(plot.dataset.url, function (data) {
+        if (data.status === 'pending') {
+            poll(data.job_url);
+        } else {
+            show(data);
+        }
+    });
+})();
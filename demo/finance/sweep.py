@@ -0,0 +1,57 @@
+import numpy as np
+from finance.cashflow import incomeSchedule, spendingSchedule
+from finance.solver import solveReqReturns
+
+def sweepShocks(years, trials, seed=None, bank=None):
+    """
+    Standardized return shocks shared by every point of a sweep (common random numbers), so differences
+    between neighbouring cells come from the inputs and not from sampling noise
+    Input:
+        years (Int): Number of simulated years
+        trials (Int): Number of simulation trials
+        seed (Int): Seed of the draws when no scenario bank is given
+        bank (Array): Optional scenario bank, its first trials columns are used as they are
+    Output: Array of shocks shaped (years, trials)
+    """
+    if bank is not None and years <= bank.shape[0] and trials <= bank.shape[1]:
+        return bank[:years, :trials]
+    return np.random.default_rng(seed).standard_normal((years, trials))
+
+def ruinProbabilities(netCashFlows, userSavings, riskProfiles, shocks):
+    """
+    Simulates every (risk level, cash flow row) pair on the same shocks in one array
+    Input:
+        netCashFlows (Array): Yearly net cash flows shaped (rows, years)
+        userSavings (Int): Current savings level
+        riskProfiles (List): (expected yearly return, yearly return standard deviation) per risk level
+        shocks (Array): Standardized shocks shaped (years, trials)
+    Output: Array of ruin probabilities (%) shaped (risks, rows), ranked like QuantileSketch.ruinProbability
+    """
+    rows, years = netCashFlows.shape
+    trials = shocks.shape[1]
+    means = np.array([r for r, _ in riskProfiles])[:, None, None]
+    risks = np.array([s for _, s in riskProfiles])[:, None, None]
+    savings = np.full((len(riskProfiles), rows, trials), float(userSavings))
+    growth = np.empty((len(riskProfiles), 1, trials))
+    for j in range(years):
+        np.multiply(risks, shocks[j], out=growth)
+        growth += means + 1
+        np.multiply(savings, growth, out=savings, where=savings >= 0)
+        savings += netCashFlows[None, :, j, None]
+    below = np.count_nonzero(savings < 0, axis=2)
+    atOrBelow = np.count_nonzero(savings <= 0, axis=2)
+    return (below + atOrBelow + (below < atOrBelow)) * (50.0/trials)
+
+def sweepGrid(userIncome, incomeGrowth, inflation, userSavings, userCurrentAge, userDeathAge, retirementAges, spendings, riskProfiles, shocks):
+    """
+    What-if sweep over retirement age, spending and investment risk evaluated as one batched computation
+    Input: User financial information that stays fixed, the swept values, the (return, risk) pair of each
+        swept risk level and the shared standardized shocks of sweepShocks
+    Output: Tuple of (required returns shaped (ages, spendings), ruin probabilities (%) shaped (risks, ages, spendings))
+    """
+    incomes = np.array([incomeSchedule(userIncome, incomeGrowth, userCurrentAge, userDeathAge, age) for age in retirementAges])
+    spendingRows = np.array([spendingSchedule(spending, inflation, userCurrentAge, userDeathAge) for spending in spendings])
+    netCashFlows = (incomes[:, None, :] - spendingRows[None, :, :]).reshape(len(retirementAges)*len(spendings), -1)
+    reqReturns = solveReqReturns(netCashFlows, userSavings).reshape(len(retirementAges), len(spendings))
+    ruin = ruinProbabilities(netCashFlows, userSavings, riskProfiles, shocks).reshape(len(riskProfiles), len(retirementAges), len(spendings))
+    return (reqReturns, ruin)
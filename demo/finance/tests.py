@@ -1,3 +1,907 @@
-from django.test import TestCase
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.http import HttpResponse
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.urls import reverse
+from django.utils import timezone
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
+from unittest import mock
+import numpy as np
+import scipy.stats as stats
+import joblib
+import json
+import os
+import pickle
+import subprocess
+import tempfile
+import time
+from finance import benchmark, cashflow, cohort, dashboard, data, executor, health_check, jobs, loadtest, lookup, metrics, parallel, pipeline, portfolio, preview, scenarios, solver, startup
+from finance import cache as finance_cache
+from finance import views
+from finance.middleware import MetricsMiddleware
+from finance.prediction import ModelRegistry, encoding_order
+from finance.sketch import QuantileSketch
+from finance.models import CohortReport, FinancialInfo, SimulationJob
 
 # Create your tests here.
+
+class SimulationEngineTests(SimpleTestCase):
+    def scalarSavings(self, lifetimeIncome, lifetimeSpending, userSavings, returns):
+        #Reference implementation of the original per-trial loop
+        path=[]
+        for j in range(len(lifetimeIncome)):
+            if userSavings < 0:
+                userSavings = userSavings + lifetimeIncome[j] - lifetimeSpending[j]
+            else:
+                userSavings = userSavings*(1+returns[j]) + lifetimeIncome[j] - lifetimeSpending[j]
+            path.append(userSavings)
+        return path
+
+    def test_vectorized_engine_matches_scalar_loop(self):
+        lifetimeIncome=health_check.yearlyTotalIncome(100, 0.02, 50, 90, 65)
+        lifetimeSpending=health_check.yearlyTotalSpending(110, 0.03, 50, 90)
+        returns=health_check.investmentResult(9, 50, 90, trials=200, rng=np.random.default_rng(0))
+        yearlyDetails=health_check.simulateSavings(lifetimeIncome, lifetimeSpending, 500, returns)
+        for t in range(returns.shape[1]):
+            expected=self.scalarSavings(lifetimeIncome, lifetimeSpending, 500, returns[:,t])
+            np.testing.assert_allclose(yearlyDetails[:,t], expected)
+
+    def test_sketch_matches_exact_percentiles_and_ruin(self):
+        yearlyDetails=np.random.default_rng(2).normal(0, 100, size=(3, 150))
+        sketch=QuantileSketch.fromPaths(yearlyDetails)
+        np.testing.assert_allclose(sketch.percentile([5, 25, 50]), np.percentile(yearlyDetails, [5, 25, 50], axis=1))
+        self.assertAlmostEqual(sketch.ruinProbability(), stats.percentileofscore(yearlyDetails[-1], 0))
+
+    def test_merged_sketch_approximates_percentiles(self):
+        yearlyDetails=np.random.default_rng(3).normal(0, 100, size=(2, 20000))
+        merged=QuantileSketch.merge([QuantileSketch.fromPaths(part) for part in np.array_split(yearlyDetails, 4, axis=1)])
+        self.assertEqual(merged.points.shape[1], 201)
+        np.testing.assert_allclose(merged.percentile([5, 50]), np.percentile(yearlyDetails, [5, 50], axis=1), atol=2)
+        self.assertAlmostEqual(merged.ruinProbability(), stats.percentileofscore(yearlyDetails[-1], 0))
+
+    def test_single_batch_summary_is_exact(self):
+        lifetimeIncome=health_check.yearlyTotalIncome(100, 0.02, 50, 90, 65)
+        lifetimeSpending=health_check.yearlyTotalSpending(110, 0.03, 50, 90)
+        summary=health_check.simSummary(lifetimeIncome, lifetimeSpending, 500, 9, 5000, np.random.default_rng(6))
+        returns=health_check.investmentResult(9, 50, 90, trials=5000, rng=np.random.default_rng(6))
+        yearlyDetails=health_check.simulateSavings(lifetimeIncome, lifetimeSpending, 500, returns)
+        np.testing.assert_allclose(summary.percentile([5, 25, 50]), np.percentile(yearlyDetails, [5, 25, 50], axis=1))
+        self.assertAlmostEqual(summary.ruinProbability(), stats.percentileofscore(yearlyDetails[-1], 0))
+
+    def test_batched_summary_stays_compact(self):
+        lifetimeIncome=health_check.yearlyTotalIncome(100, 0.02, 50, 90, 65)
+        lifetimeSpending=health_check.yearlyTotalSpending(110, 0.03, 50, 90)
+        summary=health_check.simSummary(lifetimeIncome, lifetimeSpending, 500, 9, 20000, np.random.default_rng(6), batchSize=2000)
+        self.assertEqual(summary.count, 20000)
+        self.assertEqual(summary.points.shape, (40, 201))
+
+    def test_adaptive_mode_stops_early_far_from_a_boundary(self):
+        lifetimeIncome=health_check.yearlyTotalIncome(100, 0.02, 50, 90, 65)
+        safeSpending=health_check.yearlyTotalSpending(10, 0.02, 50, 90)
+        summary=health_check.simAdaptiveSummary(lifetimeIncome, safeSpending, 500, 5, np.random.default_rng(1), batchSize=500, maxTrials=5000)
+        self.assertEqual(summary.count, 500)
+        #About half of these lifetimes end in ruin, far above every class boundary but with a 5th percentile well below zero
+        riskySpending=health_check.yearlyTotalSpending(103, 0.02, 50, 90)
+        summary=health_check.simAdaptiveSummary(lifetimeIncome, riskySpending, 0, 9, np.random.default_rng(1), batchSize=500, maxTrials=5000)
+        self.assertLess(summary.count, 5000)
+
+    def test_adaptive_mode_respects_the_cap(self):
+        with mock.patch.object(health_check, 'simDecided', return_value=False):
+            lifetimeIncome=health_check.yearlyTotalIncome(100, 0.02, 50, 60, 65)
+            lifetimeSpending=health_check.yearlyTotalSpending(100, 0.02, 50, 60)
+            summary=health_check.simAdaptiveSummary(lifetimeIncome, lifetimeSpending, 0, 5, np.random.default_rng(1), batchSize=400, maxTrials=1000)
+        self.assertEqual(summary.count, 1000)
+
+    def test_parallel_results_do_not_depend_on_worker_count(self):
+        args=(100, 0.05, 90, 0.03, 2000, 5, 50, 100, 70)
+        serial=health_check.simHealthCheck(*args, trials=3000, seed=4, workers=1, shardSize=1000)[0]
+        sharded=health_check.simHealthCheck(*args, trials=3000, seed=4, workers=2, shardSize=1000)[0]
+        self.assertEqual(serial, sharded)
+        self.assertEqual(parallel.shardSizes(3500, 1000), [1000, 1000, 1000, 500])
+
+    @override_settings(FINANCE_SIM_WORKERS=16, FINANCE_SIM_SHARD_SIZE=250)
+    def test_shard_size_setting_gives_every_worker_shards(self):
+        options=jobs.simulation_options()
+        self.assertEqual(options['shardSize'], 250)
+        self.assertGreaterEqual(len(parallel.shardSizes(options['trials'], options['shardSize'])), options['workers'])
+
+    def test_sim_health_check_is_reproducible_with_seed(self):
+        args=(100, 0.05, 90, 0.03, 2000, 5, 50, 100, 70)
+        first=health_check.simHealthCheck(*args, trials=500, seed=1)[0]
+        second=health_check.simHealthCheck(*args, trials=500, seed=1)[0]
+        self.assertEqual(first, second)
+
+
+class PreviewTests(SimpleTestCase):
+    def test_preview_is_close_to_monte_carlo(self):
+        args=(50000, 0.02, 30000, 0.02, 10000, 5, 30, 90, 65)
+        summary, _=health_check.simHealthSummary(*args, trials=20000, seed=0)
+        approx=preview.previewSummary(*args)
+        median=summary.percentile(50)
+        np.testing.assert_allclose(approx['average_case'], median, rtol=0.1, atol=1000)
+        self.assertLess(abs(approx['ruin_probability']-summary.ruinProbability()), 2)
+
+    def test_symmetric_moments_give_normal_percentiles(self):
+        np.testing.assert_allclose(preview.momentPercentiles([10.0], [4.0], [0.0], 50), [10.0])
+        self.assertAlmostEqual(preview.momentPercentiles([0.0], [1.0], [0.0], 5)[0], -1.644854, places=5)
+        self.assertAlmostEqual(preview.momentBelowZero(0.0, 1.0, 0.0), 50.0)
+
+
+class CashFlowTests(SimpleTestCase):
+    def test_schedules_match_compounded_growth(self):
+        expected=[100*1.05**t if 50+t <= 70 else 0 for t in range(50)]
+        np.testing.assert_allclose(health_check.yearlyTotalIncome(100, 0.05, 50, 100, 70), expected)
+        np.testing.assert_allclose(health_check.yearlyTotalSpending(90, 0.03, 50, 100), [90*1.03**t for t in range(50)])
+
+    def test_schedules_are_memoized_and_read_only(self):
+        schedule=cashflow.spendingSchedule(90, 0.03, 50, 100)
+        self.assertIs(cashflow.spendingSchedule(90, 0.03, 50, 100), schedule)
+        with self.assertRaises(ValueError):
+            schedule[0]=0
+
+    def test_retirement_pension_and_lump_sums(self):
+        income=cashflow.incomeSchedule(100, 0, 60, 66, 62, pension=40, pensionGrowth=0.5, lumpSums=((61, 10), (90, 5)))
+        np.testing.assert_allclose(income, [100, 110, 100, 40, 60, 90])
+        spending=cashflow.spendingSchedule(100, 0, 60, 64, 61, retirementSpendingRatio=0.5, lumpSums=((63, 25),))
+        np.testing.assert_allclose(spending, [100, 100, 50, 75])
+
+
+class PortfolioTests(SimpleTestCase):
+    def test_correlated_draws_match_covariance(self):
+        model=portfolio.PortfolioModel.default('t', degreesOfFreedom=5)
+        returns=model.assetReturns(50, 4000, np.random.default_rng(0)).reshape(-1, model.assets)
+        np.testing.assert_allclose(returns.mean(axis=0), portfolio.assetMeans, atol=0.003)
+        np.testing.assert_allclose(returns.std(axis=0), portfolio.assetRisks, rtol=0.03)
+        np.testing.assert_allclose(np.corrcoef(returns, rowvar=False), portfolio.assetCorrelation, atol=0.03)
+        #Student-t with 5 degrees of freedom has excess kurtosis 6
+        self.assertGreater(stats.kurtosis(returns[:, 0]), 2)
+
+    def test_buffers_are_reused_across_batches(self):
+        model=portfolio.PortfolioModel.default()
+        weights=portfolio.riskGlidePath(5, 30, 65, 90)
+        first=model.portfolioReturns(weights, 100, np.random.default_rng(0))
+        second=model.portfolioReturns(weights, 100, np.random.default_rng(1))
+        self.assertIs(first, second)
+        self.assertEqual(second.shape, (60, 100))
+        #Only the latest shape is kept, and another thread draws into buffers of its own
+        self.assertIsNot(model.portfolioReturns(weights, 50, np.random.default_rng(2)), second)
+        with ThreadPoolExecutor(1) as pool:
+            other=pool.submit(model.portfolioReturns, weights, 50, np.random.default_rng(3)).result()
+        self.assertIsNot(other, model.portfolioReturns(weights, 50, np.random.default_rng(4)))
+        self.assertIsInstance(pickle.loads(pickle.dumps(model)).portfolioReturns(weights, 10, np.random.default_rng(5)), np.ndarray)
+
+    @override_settings(FINANCE_SIM_PORTFOLIO='t', FINANCE_SIM_WORKERS=None)
+    def test_setting_runs_the_portfolio_model(self):
+        options=jobs.simulation_options()
+        self.assertEqual(options['portfolio'].distribution, 't')
+        self.assertIs(jobs.simulation_options()['portfolio'], options['portfolio'])
+        with override_settings(FINANCE_SIM_PORTFOLIO=None):
+            engine=finance_cache.simulation_engine()
+        self.assertNotEqual(finance_cache.simulation_engine(), engine)
+        summary, _=health_check.simHealthSummary(100, 0.05, 90, 0.03, 2000, 9, 50, 100, 70, **dict(options, trials=300, seed=1))
+        self.assertEqual(summary.count, 300)
+
+    def test_bootstrap_resamples_history(self):
+        history=np.arange(12, dtype=np.float64).reshape(4, 3)/100
+        model=portfolio.PortfolioModel.fromHistory(history)
+        returns=model.assetReturns(5, 7, np.random.default_rng(0))
+        rows={tuple(row) for row in returns.reshape(-1, 3)}
+        self.assertTrue(rows<={tuple(row) for row in history})
+
+    def test_glide_path_reaches_retirement_allocation(self):
+        weights=portfolio.riskGlidePath(9, 30, 65, 90)
+        np.testing.assert_allclose(weights.sum(axis=1), 1)
+        np.testing.assert_allclose(weights[0], [1, 0, 0])
+        np.testing.assert_allclose(weights[35:], [[0.5, 0.5, 0]]*25)
+        summary, _=health_check.simHealthSummary(100, 0.05, 90, 0.03, 2000, 9, 50, 100, 70, trials=300, seed=1,
+            portfolio=portfolio.PortfolioModel.default())
+        self.assertEqual(summary.count, 300)
+
+
+class ScenarioBankTests(SimpleTestCase):
+    def setUp(self):
+        directory=tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path=os.path.join(directory.name, 'scenarios.npy')
+        scenarios.buildBank(self.path, years=60, trials=1000, seed=3)
+
+    def test_bank_is_memory_mapped_and_reproducible(self):
+        bank=scenarios.openBank(self.path)
+        self.assertIsInstance(bank, np.memmap)
+        self.assertFalse(bank.flags.writeable)
+        args=(50000, 0.02, 40000, 0.02, 10000, 5, 30, 90, 65)
+        first=health_check.simHealthSummary(*args, trials=1000, seed=1, scenarioBank=self.path)
+        second=health_check.simHealthSummary(*args, trials=1000, seed=7, scenarioBank=self.path)
+        self.assertEqual(first[1], second[1])
+        np.testing.assert_allclose(first[0].percentile([5, 50]), second[0].percentile([5, 50]))
+
+    def test_window_is_scaled_shocks(self):
+        bank=scenarios.openBank(self.path)
+        returns=scenarios.bankReturns(bank, 0.05, 0.1, 10, 20, start=5)
+        np.testing.assert_allclose(returns, 0.05+0.1*np.asarray(bank[:10, 5:25]))
+        with self.assertRaises(ValueError):
+            scenarios.bankReturns(bank, 0.05, 0.1, 10, 1000, start=1)
+
+    def test_horizons_beyond_the_bank_fall_back_to_seeded_draws(self):
+        #The bank covers 60 years, this plan runs for 70
+        args=(50000, 0.02, 40000, 0.02, 10000, 5, 20, 90, 65)
+        banked=health_check.simHealthSummary(*args, trials=500, scenarioBank=self.path, drawSeed=4)
+        seeded=health_check.simHealthSummary(*args, trials=500, drawSeed=4)
+        self.assertEqual(banked[1], seeded[1])
+        self.assertEqual(banked[0].count, 500)
+
+    def test_bank_and_settings_are_part_of_simulation_keys(self):
+        info=FinancialInfo(pk=1, income=50000, income_growth=0.02, spending=40000, inflation=0.02, savings=10000,
+                           current_age=30, death_age=90, retirement_age=65, investment_risk=5)
+        fields=finance_cache.SIMULATION_FIELDS
+        with override_settings(FINANCE_SCENARIO_BANK=self.path+'.missing'):
+            without_bank=finance_cache.cache_key('simulation_data', info, fields)
+            seed=jobs.simulation_seed(info)
+            with override_settings(FINANCE_SIM_TRIALS=123):
+                self.assertNotEqual(finance_cache.cache_key('simulation_data', info, fields), without_bank)
+        with override_settings(FINANCE_SCENARIO_BANK=self.path):
+            with_bank=finance_cache.cache_key('simulation_data', info, fields)
+            self.assertNotEqual(with_bank, without_bank)
+            #The draws seed does not depend on the bank
+            self.assertEqual(jobs.simulation_seed(info), seed)
+            scenarios.buildBank(self.path, years=60, trials=1000, seed=4)
+            os.utime(self.path, ns=(10**9, 10**9))
+            self.assertNotEqual(finance_cache.cache_key('simulation_data', info, fields), with_bank)
+
+    def test_command_writes_bank(self):
+        out=StringIO()
+        call_command('build_scenario_bank', output=self.path, years=5, trials=8, stdout=out)
+        self.assertEqual(scenarios.openBank(self.path).shape, (5, 8))
+        self.assertIn('5 x 8 scenarios', out.getvalue())
+
+
+class ReqReturnSolverTests(SimpleTestCase):
+    def test_solution_zeroes_terminal_wealth(self):
+        lifetimeIncome=health_check.yearlyTotalIncome(50000, 0.02, 30, 90, 65)
+        lifetimeSpending=health_check.yearlyTotalSpending(40000, 0.03, 30, 90)
+        reqReturn, stats=solver.solveReqReturn(lifetimeIncome, lifetimeSpending, 10000)
+        self.assertTrue(0 < reqReturn < solver.maxReqReturn)
+        self.assertTrue(stats['converged'])
+        self.assertLess(abs(solver.terminalWealth(reqReturn, lifetimeIncome, lifetimeSpending, 10000)[0]), 1)
+        self.assertGreater(stats['function_calls'], stats['grid_size'])
+
+    def test_unreachable_goal_reports_cap(self):
+        reqReturn, stats=solver.solveUserReqReturn(100, 0, 1000, 0.03, 0, 30, 90, 65)
+        self.assertEqual(reqReturn, solver.maxReqReturn)
+        self.assertFalse(stats['converged'])
+
+    def test_no_investment_needed(self):
+        reqReturn, _=solver.solveUserReqReturn(1000, 0, 100, 0, 0, 30, 90, 90)
+        self.assertEqual(reqReturn, 0)
+
+    def test_batched_solver_matches_single_solver(self):
+        users=[(50000, 0.02, 40000, 0.03, 10000, 30, 90, 65), (100, 0, 1000, 0.03, 0, 30, 90, 65), (1000, 0, 100, 0, 0, 30, 90, 90)]
+        netCashFlows=[health_check.yearlyTotalIncome(i, g, c, d, r)-health_check.yearlyTotalSpending(s, f, c, d) for i, g, s, f, _, c, d, r in users]
+        expected=[solver.solveUserReqReturn(*user)[0] for user in users]
+        np.testing.assert_allclose(solver.solveReqReturns(netCashFlows, [user[4] for user in users]), expected, atol=1e-6)
+
+
+class FinanceViewTestCase(TestCase):
+    financial_data={'income':50000, 'income_growth':0.02, 'spending':40000, 'inflation':0.02, 'savings':10000,
+        'current_age':30, 'death_age':90, 'retirement_age':65, 'investment_risk':5,
+        'FWB1_3':'Somewhat', 'FWB1_5':'Somewhat', 'FWB1_6':'Somewhat', 'FWB2_1':'Rarely', 'FWB2_3':'Never'}
+
+    def setUp(self):
+        finance_cache.get_cache().clear()
+        self.user=get_user_model().objects.create_user(username='tester', password='secret-pass-123')
+        self.info=FinancialInfo.objects.create(user=self.user, **self.financial_data)
+        self.client.login(username='tester', password='secret-pass-123')
+
+
+class DataLayerTests(FinanceViewTestCase):
+    def test_row_is_fetched_once_per_request(self):
+        request=RequestFactory().get('/')
+        request.user=self.user
+        with self.assertNumQueries(1):
+            q=data.get_financial_info(request, 'req_return', 'simulation', 'prediction')
+            self.assertIs(data.get_financial_info(request, 'simulation'), q)
+            self.assertIs(data.get_financial_info(request, 'prediction'), q)
+            self.assertEqual(str(q), 'tester')
+            self.assertEqual((q.spending, q.investment_risk, q.FWB2_1), (40000, 5, 'Rarely'))
+
+    def test_wider_field_set_refetches(self):
+        request=RequestFactory().get('/')
+        request.user=self.user
+        with self.assertNumQueries(2):
+            data.get_financial_info(request, 'req_return')
+            q=data.get_financial_info(request, 'prediction')
+            q.FWB1_3
+            q.income
+
+    @override_settings(FINANCE_SIM_PREVIEW=False, FINANCE_ASYNC_SIMULATION=False, FINANCE_CHART_MODE='bokeh')
+    def test_simulation_view_reads_row_with_one_query(self):
+        url=reverse('finance:simulation', kwargs={'slug':self.info.slug})
+        finance_cache.store('simulation', self.info, finance_cache.SIMULATION_FIELDS, ('diagnosis', 'script', 'div'))
+        self.client.get(url)
+        #Session and user lookups come from the auth middleware, the view itself adds one query
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+
+class DashboardTests(FinanceViewTestCase):
+    def test_sections_stream_in_completion_order(self):
+        url=reverse('finance:dashboard', kwargs={'slug':self.info.slug})
+        def slow_simulation(*args, **kwargs):
+            time.sleep(0.5)
+            return ('sim diagnosis', '', '<div>plot</div>')
+        with mock.patch.object(health_check, 'simHealthCheck', side_effect=slow_simulation), \
+             mock.patch('finance.lookup.table.predict', return_value='prediction diagnosis'):
+            response=self.client.get(url)
+            chunks=[chunk.decode() for chunk in response.streaming_content]
+        self.assertEqual(response['X-Accel-Buffering'], 'no')
+        page=''.join(chunks)
+        self.assertIn('Analysis Results', chunks[0])
+        sections=[chunk for chunk in chunks if chunk.startswith('<section')]
+        self.assertEqual(len(sections), 3)
+        #The slow simulation is listed before the prediction but streamed after the sections that finished before it
+        self.assertIn('sim diagnosis', sections[-1])
+        self.assertFalse(chunks[-1].startswith('<section'))
+        for text in ['sim diagnosis', '<div>plot</div>', 'prediction diagnosis', health_check.reqReturnHealthCheck(50000, 0.02, 40000, 0.02, 10000, 30, 90, 65)]:
+            self.assertIn(text, page)
+
+    def test_failed_section_does_not_break_the_page(self):
+        with mock.patch.object(health_check, 'simHealthCheck', side_effect=RuntimeError('boom')), \
+             mock.patch('finance.lookup.table.predict', return_value='prediction diagnosis'):
+            with self.assertLogs('finance.dashboard', 'ERROR'):
+                sections={name:context for name, _, context in dashboard.run_sections(self.info)}
+        self.assertIn('error', sections['simulation'])
+        self.assertEqual(sections['prediction']['diagnosis'], 'prediction diagnosis')
+
+
+class AsyncViewTests(FinanceViewTestCase):
+    def get(self, view, user, data=None, **extra):
+        request=RequestFactory().get('/finance/', data, **extra)
+        request.user=user
+        return async_to_sync(view.as_view())(request, slug=self.info.slug)
+
+    def test_sweep_matches_sync_view(self):
+        query={'retirement_age':'60,65', 'spending':'35000,40000', 'investment_risk':'1'}
+        response=self.get(views.AsyncSweepView, self.user, query)
+        expected=self.client.get(reverse('finance:sweep', kwargs={'slug':self.info.slug}), query)
+        self.assertEqual(json.loads(response.content), expected.json())
+        self.assertEqual(self.get(views.AsyncSweepView, self.user, {'investment_risk':'0'}).status_code, 400)
+
+    @override_settings(FINANCE_ASYNC_SIMULATION=False, FINANCE_SIM_TRIALS=200)
+    def test_simulation_data_supports_etag_revalidation(self):
+        response=self.get(views.AsyncSimulationDataView, self.user)
+        self.assertEqual(len(json.loads(response.content)['series']['worst_case']), self.info.death_age-self.info.current_age)
+        self.assertIn('no-cache', response['Cache-Control'])
+        revalidated=self.get(views.AsyncSimulationDataView, self.user, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_dashboard_streams_every_section(self):
+        async def read(response):
+            return [chunk.decode() async for chunk in response.streaming_content]
+        with mock.patch.object(health_check, 'simHealthCheck', return_value=('sim diagnosis', '', '<div>plot</div>')), \
+             mock.patch('finance.lookup.table.predict', return_value='prediction diagnosis'):
+            response=self.get(views.AsyncDashboardView, self.user)
+            chunks=async_to_sync(read)(response)
+        self.assertIn('Analysis Results', chunks[0])
+        self.assertEqual(sum(1 for chunk in chunks if chunk.startswith('<section')), 3)
+        self.assertIn('prediction diagnosis', ''.join(chunks))
+
+    def test_req_return_view_renders(self):
+        response=self.get(views.AsyncReqReturnView, self.user)
+        self.assertContains(response, health_check.reqReturnHealthCheck(50000, 0.02, 40000, 0.02, 10000, 30, 90, 65))
+
+    def test_anonymous_user_is_redirected(self):
+        response=self.get(views.AsyncPredictionView, AnonymousUser())
+        self.assertEqual(response.status_code, 302)
+
+    def test_saturated_executor_answers_503(self):
+        bounded=executor.BoundedExecutor(workers=1, queue=0)
+        #Take the only slot as a running simulation would
+        bounded.slots.acquire()
+        with mock.patch.object(executor, 'get_executor', return_value=bounded):
+            response=self.get(views.AsyncReqReturnView, self.user)
+            dashboard_response=self.get(views.AsyncDashboardView, self.user)
+        bounded.slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(dashboard_response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+    def test_failed_submission_gives_its_slot_back(self):
+        bounded=executor.BoundedExecutor(workers=1, queue=0)
+        bounded.pool.shutdown()
+        for _ in range(3):
+            with self.assertRaises(RuntimeError):
+                async_to_sync(bounded.run)(abs, -1)
+        self.assertTrue(bounded.slots.acquire(blocking=False))
+
+
+class SweepTests(FinanceViewTestCase):
+    def test_grid_matches_single_analyses(self):
+        url=reverse('finance:sweep', kwargs={'slug':self.info.slug})
+        response=self.client.get(url, {'retirement_age':'60:70:5', 'spending':'35000,40000', 'investment_risk':'1,9'})
+        data=response.json()
+        self.assertEqual(data['retirement_age'], [60, 65, 70])
+        self.assertEqual(np.shape(data['required_return']), (3, 2))
+        self.assertEqual(np.shape(data['ruin_probability']), (2, 3, 2))
+        reqReturn, _=solver.solveUserReqReturn(50000, 0.02, 40000, 0.02, 10000, 30, 90, 65)
+        self.assertAlmostEqual(data['required_return'][1][1], reqReturn, places=5)
+        #Common random numbers keep the cells ordered: retiring later or spending less never raises the ruin risk
+        ruin=np.array(data['ruin_probability'])
+        self.assertTrue((np.diff(ruin, axis=1)<=0).all() and (np.diff(ruin, axis=2)>=0).all())
+
+    def test_missing_fields_default_to_the_saved_values(self):
+        data=self.client.get(reverse('finance:sweep', kwargs={'slug':self.info.slug})).json()
+        self.assertEqual((data['retirement_age'], data['spending'], data['investment_risk']), ([65], [40000], [5]))
+
+    def test_invalid_ranges_are_rejected(self):
+        url=reverse('finance:sweep', kwargs={'slug':self.info.slug})
+        for query in [{'spending':'1:10:0'}, {'retirement_age':'20,65'}, {'investment_risk':'x'}, {'spending':'0:1000000:1'},
+                      {'spending':'0:%d:1' % 10**30}, {'spending':'%d:%d:1' % (-10**30, 10**30)}]:
+            self.assertEqual(self.client.get(url, query).status_code, 400)
+
+
+@override_settings(FINANCE_SIM_PREVIEW=False, FINANCE_ASYNC_SIMULATION=False, FINANCE_CHART_MODE='bokeh')
+class ResultCacheTests(FinanceViewTestCase):
+    def test_simulation_is_computed_once_until_update(self):
+        url=reverse('finance:simulation', kwargs={'slug':self.info.slug})
+        with mock.patch.object(health_check, 'simHealthCheck', return_value=('diagnosis', 'script', 'div')) as sim:
+            self.client.get(url)
+            response=self.client.get(url)
+            self.assertEqual(sim.call_count, 1)
+            self.assertContains(response, 'diagnosis')
+            data=dict(self.financial_data, spending=45000)
+            self.client.post(reverse('finance:update', kwargs={'slug':self.info.slug}), data)
+            self.client.get(url)
+            self.assertEqual(sim.call_count, 2)
+
+    def test_invalidate_drops_entries(self):
+        finance_cache.get_or_compute('req_return', self.info, finance_cache.REQ_RETURN_FIELDS, lambda: 'first')
+        finance_cache.invalidate(self.info)
+        result=finance_cache.get_or_compute('req_return', self.info, finance_cache.REQ_RETURN_FIELDS, lambda: 'second')
+        self.assertEqual(result, 'second')
+
+
+class PipelineTests(FinanceViewTestCase):
+    def test_stages_declare_their_fields(self):
+        self.assertEqual(pipeline.affected_stages(['FWB1_3']), {'prediction'})
+        self.assertEqual(pipeline.affected_stages(['inflation']), {'spending_schedule', 'req_return', 'simulation'})
+        self.assertEqual(pipeline.affected_stages(['investment_risk']), {'simulation'})
+        self.assertEqual(set(pipeline.stage_fields('simulation')), set(finance_cache.REQ_RETURN_FIELDS+['investment_risk']))
+
+    def test_update_only_drops_affected_results(self):
+        finance_cache.store('req_return', self.info, finance_cache.REQ_RETURN_FIELDS, 'req return')
+        finance_cache.store('prediction', self.info, finance_cache.PREDICTION_FIELDS, 'prediction')
+        data=dict(self.financial_data, FWB1_3='Completely')
+        self.client.post(reverse('finance:update', kwargs={'slug':self.info.slug}), data)
+        self.info.refresh_from_db()
+        self.assertEqual(finance_cache.get('req_return', self.info, finance_cache.REQ_RETURN_FIELDS), 'req return')
+        self.info.FWB1_3='Somewhat'
+        self.assertIsNone(finance_cache.get('prediction', self.info, finance_cache.PREDICTION_FIELDS))
+
+    def test_spending_change_reuses_return_draws(self):
+        options=jobs.simulation_options(self.info)
+        health_check.simHealthSummary(*jobs.simulation_arguments(self.info), **options)
+        self.info.spending=45000
+        self.assertEqual(jobs.simulation_options(self.info), options)
+        before=scenarios.seededShocks.cache_info()
+        health_check.simHealthSummary(*jobs.simulation_arguments(self.info), **options)
+        after=scenarios.seededShocks.cache_info()
+        self.assertEqual((after.hits-before.hits, after.misses-before.misses), (1, 0))
+
+
+class CohortTests(FinanceViewTestCase):
+    users=[(50000, 0.02, 40000, 0.02, 10000, 30, 90, 65, 5), (100, 0.05, 90, 0.03, 2000, 50, 100, 70, 9), (1000, 0, 100, 0, 0, 60, 70, 65, 1)]
+
+    def test_chunk_matches_per_user_engines(self):
+        shocks=np.random.default_rng(0).standard_normal((60, 1000))
+        results=cohort.cohortHealthCheck(self.users, shocks)
+        for i, (income, growth, spending, inflation, savings, current, death, retirement, risk) in enumerate(self.users):
+            reqReturn, _=solver.solveUserReqReturn(income, growth, spending, inflation, savings, current, death, retirement)
+            self.assertAlmostEqual(results['req_return'][i], reqReturn, places=6)
+            #The same shocks through the per-user engine give the same trials
+            assetReturn, assetRisk=health_check.riskReturnProfile(risk)
+            summary=health_check.simSummary(health_check.yearlyTotalIncome(income, growth, current, death, retirement),
+                health_check.yearlyTotalSpending(spending, inflation, current, death), savings, risk, 1000, None,
+                drawReturns=scenarios.bankDraws(shocks, assetReturn, assetRisk, death-current))
+            self.assertAlmostEqual(results['ruin_probability'][i], summary.ruinProbability())
+            self.assertAlmostEqual(results['worst_case'][i], summary.percentile(5)[-1], delta=1e-6*abs(results['worst_case'][i])+1e-6)
+
+    def test_command_writes_a_row_per_user(self):
+        for n, user in enumerate(self.users[1:]):
+            owner=get_user_model().objects.create_user(username='cohort%d' % n)
+            FinancialInfo.objects.create(user=owner, **dict(zip(cohort.cohortFields, user)))
+        out=StringIO()
+        call_command('cohort_report', chunk_size=2, trials=200, stdout=out)
+        self.assertEqual(CohortReport.objects.count(), 3)
+        self.assertEqual(CohortReport.objects.values('run_at').distinct().count(), 1)
+        self.assertIn('Reported 3 users', out.getvalue())
+
+
+class MetricsTests(FinanceViewTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    @override_settings(FINANCE_SIM_PREVIEW=False, FINANCE_ASYNC_SIMULATION=False, FINANCE_CHART_MODE='bokeh', FINANCE_SIM_TRIALS=200)
+    def test_stages_and_requests_are_exported(self):
+        with mock.patch.object(metrics, 'enabled', True):
+            self.client.get(reverse('finance:simulation', kwargs={'slug':self.info.slug}))
+            response=self.client.get(reverse('metrics'))
+        text=response.content.decode()
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        for stage in ['db_fetch', 'schedules', 'return_draws', 'simulation_loop', 'percentiles', 'bokeh_render', 'template_render']:
+            self.assertIn('finance_stage_seconds_count{stage="%s"} 1' % stage, text)
+        self.assertIn('finance_requests_total{method="GET",status="200",view="finance:simulation"} 1', text)
+        self.assertIn('finance_request_seconds_bucket{view="finance:simulation",le="+Inf"} 1', text)
+
+    def test_async_requests_are_timed_without_adapting(self):
+        async def get_response(request):
+            return HttpResponse('ok')
+        middleware=MetricsMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request=RequestFactory().get('/')
+        with mock.patch.object(metrics, 'enabled', True):
+            response=async_to_sync(middleware)(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('finance_requests_total{method="GET",status="200",view="unresolved"} 1', metrics.render())
+
+    def test_disabled_metrics_record_nothing(self):
+        self.assertIs(metrics.timer('a'), metrics.timer('b'))
+        with metrics.timer('a'):
+            pass
+        self.assertEqual(metrics.render(), '\n')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+class LoadTestTests(FinanceViewTestCase):
+    def test_seeded_users_have_sessions_and_paths(self):
+        users=loadtest.targets(loadtest.seed_users(3))
+        self.assertEqual([u['username'] for u in users], ['loadtest0', 'loadtest1', 'loadtest2'])
+        self.assertEqual(FinancialInfo.objects.filter(user__username__startswith='loadtest').count(), 3)
+        self.client.logout()
+        name, key=users[1]['cookie'].split('=')
+        self.client.cookies[name]=key
+        response=self.client.get(users[1]['paths']['profile'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['financial_info'].slug, 'loadtest1')
+
+    def test_command_refuses_the_project_database(self):
+        with self.assertRaisesMessage(CommandError, 'loadtest_settings'):
+            call_command('load_test', stdout=StringIO())
+
+    def test_run_leaves_no_worker_or_pool_processes(self):
+        directory=tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path=os.path.join(directory.name, 'pids')
+        class PoolServer:
+            server_address=('127.0.0.1', 0)
+            def serve_forever(self):
+                #A worker whose requests started a sharded simulation pool, then idles like a server
+                pool=parallel.getPool(2)
+                pool.submit(os.getpid).result()
+                pids=list(pool._processes)
+                with open(path, 'a') as f:
+                    f.write(' '.join(map(str, [os.getpid()]+pids))+'\n')
+                while True:
+                    time.sleep(0.1)
+            def server_close(self):
+                pass
+        def wait_for_workers(port, users, concurrency, duration, endpoints, seed):
+            while not os.path.exists(path) or len(open(path).read().splitlines())<2:
+                time.sleep(0.05)
+            return []
+        with mock.patch.object(loadtest, 'make_server', PoolServer), mock.patch.object(loadtest, 'generate_load', wait_for_workers):
+            loadtest.run([], workers=(2,), threads=(1,), duration=0.1, warmup=0)
+        pids=[int(pid) for line in open(path).read().splitlines() for pid in line.split()]
+        self.assertGreater(len(pids), 2)
+        def alive(pid):
+            try:
+                with open('/proc/%d/stat' % pid) as f:
+                    return f.read().rsplit(')', 1)[1].split()[0]!='Z'
+            except FileNotFoundError:
+                return False
+        deadline=time.time()+5
+        while any(map(alive, pids)) and time.time()<deadline:
+            time.sleep(0.05)
+        self.assertEqual([pid for pid in pids if alive(pid)], [])
+
+    def test_summary_reports_throughput_errors_and_percentiles(self):
+        samples=[('profile', 0.01*i, True) for i in range(1, 101)]+[('login', 0.5, False)]*4
+        summary=loadtest.summarize(samples, duration=2)
+        self.assertEqual(summary['requests'], 104)
+        self.assertAlmostEqual(summary['throughput_rps'], 52)
+        self.assertAlmostEqual(summary['endpoints']['login']['error_rate'], 1)
+        self.assertEqual(summary['endpoints']['profile']['error_rate'], 0)
+        self.assertAlmostEqual(summary['endpoints']['profile']['p50_s'], 0.505)
+
+
+class ModelRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.directory=tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        for f in ModelRegistry.model_files:
+            joblib.dump({'name':f}, os.path.join(self.directory.name, f))
+
+    def test_models_load_once_and_reload_on_content_change(self):
+        registry=ModelRegistry(self.directory.name)
+        encoder, model=registry.get()
+        self.assertEqual(model, {'name':'fwb_model'})
+        version, loaded_at=registry.version, registry.loaded_at
+        self.assertIs(registry.get()[1], model)
+        #A touched but unchanged file is not unpickled again
+        model_path=os.path.join(self.directory.name, 'fwb_model')
+        os.utime(model_path, ns=(0, 0))
+        registry.get()
+        self.assertEqual(registry.loaded_at, loaded_at)
+        joblib.dump({'name':'retrained'}, model_path)
+        os.utime(model_path, ns=(10**9, 10**9))
+        self.assertEqual(registry.get()[1], {'name':'retrained'})
+        self.assertNotEqual(registry.version, version)
+        self.assertIsNotNone(registry.load_time)
+
+
+class FakeEncoder:
+    def transform(self, input_data):
+        return np.array([[len(answer) for answer in row] for row in input_data])
+
+class FakeModel:
+    def predict(self, input_data):
+        return input_data.sum(axis=1)
+
+class DoubledModel:
+    def predict(self, input_data):
+        return 2*input_data.sum(axis=1)
+
+
+class BatchPredictionTests(FinanceViewTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher=mock.patch('finance.prediction.registry.get', return_value=(FakeEncoder(), FakeModel()))
+        self.registry_get=patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_score_fwb_scores_every_row_in_bulk(self):
+        other=get_user_model().objects.create_user(username='other', password='secret-pass-123')
+        FinancialInfo.objects.create(user=other, **dict(self.financial_data, FWB1_3='Completely'))
+        call_command('score_fwb', chunk_size=1, stdout=StringIO())
+        scores=dict(FinancialInfo.objects.values_list('user__username', 'fwb_score'))
+        self.assertEqual(scores, {'tester':35.0, 'other':37.0})
+
+
+class LookupTableTests(SimpleTestCase):
+    def setUp(self):
+        directory=tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory=directory.name
+        joblib.dump(FakeEncoder(), os.path.join(self.directory, 'fwb_encoder'))
+        joblib.dump(FakeModel(), os.path.join(self.directory, 'fwb_model'))
+        self.path=os.path.join(self.directory, 'table.npz')
+
+    def test_codes_follow_combination_order(self):
+        choices=lookup.answer_choices()
+        rows=lookup.all_combinations(choices)
+        self.assertEqual(len(rows), 6**5)
+        for code in [0, 1, 6, 1234, 6**5-1]:
+            self.assertEqual(lookup.combination_code(rows[code], choices), code)
+
+    def test_table_answers_like_the_model_and_follows_model_changes(self):
+        answers={'FWB1_3':'Somewhat', 'FWB1_5':'Very well', 'FWB1_6':'Refused', 'FWB2_1':'Rarely', 'FWB2_3':'Never'}
+        table=lookup.LookupTable(self.path, ModelRegistry(self.directory))
+        self.assertEqual(table.predict(answers), FakeModel().predict(FakeEncoder().transform([[answers[p] for p in encoding_order]]))[0])
+        #A new process reads the file instead of running the model
+        with mock.patch('finance.prediction.make_predictions') as make_predictions:
+            self.assertEqual(lookup.LookupTable(self.path, ModelRegistry(self.directory)).predict(answers), table.predict(answers))
+            self.assertFalse(make_predictions.called)
+        model_path=os.path.join(self.directory, 'fwb_model')
+        joblib.dump(DoubledModel(), model_path)
+        os.utime(model_path, ns=(10**9, 10**9))
+        self.assertEqual(table.predict(answers), 2*FakeModel().predict(FakeEncoder().transform([[answers[p] for p in encoding_order]]))[0])
+
+    def test_table_out_of_code_order_is_rejected(self):
+        table=lookup.LookupTable(self.path, ModelRegistry(self.directory))
+        table.choices=lookup.answer_choices()
+        with mock.patch('finance.lookup.combination_code', side_effect=lambda row, choices: 0):
+            with self.assertRaises(RuntimeError):
+                table.build('version')
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_build_writes_through_its_own_temporary_file(self):
+        table=lookup.LookupTable(self.path, ModelRegistry(self.directory))
+        table.load()
+        #The fixed temporary name an older build used, a concurrent build must not touch it
+        stale=self.path+'.tmp.npz'
+        open(stale, 'w').close()
+        table.load(rebuild=True)
+        self.assertEqual(os.path.getsize(stale), 0)
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(['fwb_encoder', 'fwb_model', 'table.npz', 'table.npz.tmp.npz']))
+
+
+@override_settings(FINANCE_SIM_PREVIEW=False, FINANCE_ASYNC_SIMULATION=False, FINANCE_CHART_MODE='json')
+class SimulationDataTests(FinanceViewTestCase):
+    def test_page_links_to_json_series(self):
+        response=self.client.get(reverse('finance:simulation', kwargs={'slug':self.info.slug}))
+        self.assertEqual(response.context['data_url'], reverse('finance:simulation_data', kwargs={'slug':self.info.slug}))
+        self.assertNotContains(response, 'Bokeh.safely')
+
+    @override_settings(FINANCE_SIM_PREVIEW=True)
+    def test_preview_is_rendered_with_a_link_to_the_full_run(self):
+        url=reverse('finance:simulation', kwargs={'slug':self.info.slug})
+        with mock.patch.object(health_check, 'simHealthCheckData') as sim:
+            response=self.client.get(url)
+        self.assertFalse(sim.called)
+        self.assertEqual(response.context['full_url'], url+'?full=1')
+        self.assertContains(response, 'id="preview-data"')
+        self.assertEqual(list(response.context['preview']['series']), ['average_case'])
+        self.assertEqual(len(response.context['preview']['series']['average_case']), self.info.death_age-self.info.current_age)
+        full=self.client.get(url, {'full':'1'})
+        self.assertNotIn('preview', full.context)
+        self.assertEqual(full.context['data_url'], reverse('finance:simulation_data', kwargs={'slug':self.info.slug}))
+
+    @override_settings(FINANCE_SIM_PREVIEW=True)
+    def test_preview_of_a_ruin_prone_plan_gives_no_diagnosis(self):
+        #Spending well above income: the analytic tails and ruin probability are unreliable here
+        FinancialInfo.objects.filter(pk=self.info.pk).update(spending=80000, savings=0, investment_risk=9)
+        response=self.client.get(reverse('finance:simulation', kwargs={'slug':self.info.slug}))
+        self.assertContains(response, 'rough estimate')
+        self.assertNotContains(response, 'financial trouble is')
+        self.assertNotContains(response, 'dollars left')
+        self.assertNotIn('worst_case', response.context['preview']['series'])
+
+    def test_series_endpoint_supports_etag_revalidation(self):
+        url=reverse('finance:simulation_data', kwargs={'slug':self.info.slug})
+        response=self.client.get(url)
+        data=response.json()
+        self.assertEqual(len(data['series']['worst_case']), self.info.death_age-self.info.current_age)
+        self.assertIn('financial', data['diagnosis'])
+        with mock.patch.object(health_check, 'simHealthCheckData') as sim:
+            revalidated=self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertFalse(sim.called)
+        #A recomputed entry is identical to the one the ETag was issued for
+        finance_cache.get_cache().clear()
+        self.assertEqual(self.client.get(url).json(), data)
+
+
+class InlineExecutor:
+    def __init__(self):
+        self.pending=[]
+
+    def submit(self, fn, *args, **kwargs):
+        future=Future()
+        self.pending.append((future, fn, args, kwargs))
+        return future
+
+    def run_pending(self):
+        for future, fn, args, kwargs in self.pending:
+            future.set_result(fn(*args, **kwargs))
+        self.pending=[]
+
+
+@override_settings(FINANCE_SIM_PREVIEW=False, FINANCE_ASYNC_SIMULATION=True, FINANCE_CHART_MODE='bokeh')
+class SimulationJobTests(FinanceViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.executor=InlineExecutor()
+        patcher=mock.patch.object(jobs, 'get_executor', return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_identical_pending_requests_share_a_job(self):
+        url=reverse('finance:simulation', kwargs={'slug':self.info.slug})
+        first=self.client.get(url)
+        second=self.client.get(url)
+        self.assertEqual(first.context['job_url'], second.context['job_url'])
+        self.assertEqual(SimulationJob.objects.count(), 1)
+        self.assertEqual(len(self.executor.pending), 1)
+        self.assertEqual(self.client.get(first.context['job_url']).json(), {'status':'pending'})
+
+    def test_finished_job_is_served_from_status_endpoint_and_cache(self):
+        url=reverse('finance:simulation', kwargs={'slug':self.info.slug})
+        job_url=self.client.get(url).context['job_url']
+        with mock.patch.object(health_check, 'simHealthCheck', return_value=('diagnosis', 'script', 'div')):
+            self.executor.run_pending()
+        self.assertEqual(self.client.get(job_url).json(), {'status':'done', 'diagnosis':'diagnosis', 'script':'script', 'div':'div'})
+        response=self.client.get(url)
+        self.assertNotIn('job_url', response.context)
+        self.assertContains(response, 'diagnosis')
+
+    @override_settings(FINANCE_SIM_TRIALS=200)
+    def test_series_are_computed_by_a_job(self):
+        url=reverse('finance:simulation_data', kwargs={'slug':self.info.slug})
+        pending=self.client.get(url)
+        self.assertEqual(pending.status_code, 202)
+        self.assertFalse(pending.has_header('ETag'))
+        job_url=pending.json()['job_url']
+        self.assertEqual(self.client.get(url).json()['job_url'], job_url)
+        self.executor.run_pending()
+        job=self.client.get(job_url).json()
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(len(job['series']['worst_case']), self.info.death_age-self.info.current_age)
+        response=self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'diagnosis':job['diagnosis'], 'series':job['series']})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_orphaned_pending_job_is_failed_and_resubmitted(self):
+        url=reverse('finance:simulation', kwargs={'slug':self.info.slug})
+        first=self.client.get(url).context['job_url']
+        SimulationJob.objects.update(created_at=timezone.now()-timedelta(hours=1))
+        second=self.client.get(url).context['job_url']
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.client.get(first).json()['status'], 'failed')
+        self.assertEqual(len(self.executor.pending), 2)
+
+    @override_settings(FINANCE_SIM_TRIALS=200)
+    def test_concurrent_identical_requests_create_one_job(self):
+        first=jobs.submit_simulation(self.info)
+        #A request that looked for the pending job before the first one created it
+        with mock.patch('django.db.models.query.QuerySet.first', return_value=None):
+            second=jobs.submit_simulation(self.info)
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(SimulationJob.objects.count(), 1)
+        self.assertEqual(len(self.executor.pending), 1)
+        self.executor.run_pending()
+        self.assertIsNone(SimulationJob.objects.get().pending_key)
+
+    def test_callback_in_the_request_thread_keeps_its_connection(self):
+        future=Future()
+        future.set_result(('diagnosis', 'script', 'div'))
+        self.executor.submit=lambda *args, **kwargs: future
+        with mock.patch.object(jobs, 'connection') as connection:
+            job=jobs.submit_simulation(self.info)
+        self.assertFalse(connection.close.called)
+        job.refresh_from_db()
+        self.assertEqual(job.status, SimulationJob.DONE)
+
+    def test_status_endpoint_hides_other_users_jobs(self):
+        job=SimulationJob.objects.create(financial_info=self.info, key='key')
+        get_user_model().objects.create_user(username='other', password='secret-pass-123')
+        self.client.login(username='other', password='secret-pass-123')
+        self.assertEqual(self.client.get(reverse('finance:job_status', kwargs={'pk':job.pk})).status_code, 404)
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_measure_reports_latency_and_memory(self):
+        entry=benchmark.measure(lambda: np.ones(1000), repeat=2)
+        self.assertLessEqual(entry['min_s'], entry['max_s'])
+        self.assertGreaterEqual(entry['peak_memory_bytes'], 8000)
+
+    def test_parse_importtime_report(self):
+        report='import time: self [us] | cumulative | imported package\nimport time:       120 |        120 |   numpy.version\nimport time:      3000 |       3120 | numpy\n'
+        entries=startup.parse_importtime(report)
+        self.assertEqual([(e['module'], e['depth']) for e in entries], [('numpy.version', 1), ('numpy', 0)])
+        self.assertAlmostEqual(entries[1]['cumulative_s'], 0.00312)
+
+    def test_failed_startup_reports_the_child_output(self):
+        for stderr, returncode in [('', 1), ('', 0), ('import time: self [us] | cumulative | imported package\nTraceback\nImportError: boom\n', 1)]:
+            process=subprocess.CompletedProcess([], returncode, stdout='partial', stderr=stderr)
+            with mock.patch('subprocess.run', return_value=process):
+                with self.assertRaises(CommandError) as raised:
+                    call_command('startup_profile', stdout=StringIO())
+            self.assertIn('stdout: partial', str(raised.exception))
+        self.assertIn('ImportError: boom', str(raised.exception))
+        self.assertNotIn('import time', str(raised.exception))
+
+    def test_cases_cover_the_sweep_once(self):
+        entries=[(name, tuple(sorted(params.items()))) for name, params, _ in benchmark.cases(horizons=[10], trials=[100, 200], risks=[1, 5], prediction=False)]
+        self.assertEqual(len(entries), len(set(entries)))
+        self.assertEqual([dict(params)['trials'] for name, params in entries if name=='simGraph'], [100, 200])
+        self.assertEqual(len([name for name, _ in entries if name=='previewSeries']), 2)
+
+    def test_preview_accuracy_report(self):
+        entries=benchmark.preview_accuracy(horizons=[25], risks=[1, 5], trials=2000)
+        self.assertEqual([e['params']['risk'] for e in entries], [1, 5])
+        for entry in entries:
+            self.assertLess(abs(entry['ruin_error_pp']), 5)
+            self.assertLess(abs(entry['p50_error']), 0.1)
+
+    def test_compare_flags_regressions(self):
+        baseline={'results':[{'name':'simGraph', 'params':{'trials':10}, 'median_s':1.0, 'peak_memory_bytes':100}]}
+        current={'results':[{'name':'simGraph', 'params':{'trials':10}, 'median_s':1.5, 'peak_memory_bytes':100}]}
+        self.assertEqual(len(benchmark.compare(baseline, current)), 1)
+        self.assertEqual(benchmark.compare(baseline, baseline), [])
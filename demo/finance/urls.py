@@ -1,13 +1,25 @@
+from django.conf import settings
 from django.urls import path
 from finance import views
 
 app_name='finance'
+#The ASGI entry point switches the analysis pages to their async variants
+if getattr(settings, 'FINANCE_ASYNC_VIEWS', False):
+    ReqReturnView, SimulationView, PredictionView=views.AsyncReqReturnView, views.AsyncSimulationView, views.AsyncPredictionView
+    SimulationDataView, SweepView, DashboardView=views.AsyncSimulationDataView, views.AsyncSweepView, views.AsyncDashboardView
+else:
+    ReqReturnView, SimulationView, PredictionView=views.ReqReturnView, views.SimulationView, views.PredictionView
+    SimulationDataView, SweepView, DashboardView=views.SimulationDataView, views.SweepView, views.DashboardView
 urlpatterns = [
     path('', views.FinanceIndexView.as_view(), name='index'),
     path('create/', views.FinanceCreateView.as_view(), name='create'),
     path('update/<slug>/', views.FinanceUpdateView.as_view(), name='update'),
-    path('req_return_analysis/<slug>/', views.ReqReturnView.as_view(), name='req_return'),
-    path('simulation_analysis/<slug>/', views.SimulationView.as_view(), name='simulation'),
-    path('prediction/<slug>/', views.PredictionView.as_view(), name='prediction'),
+    path('req_return_analysis/<slug>/', ReqReturnView.as_view(), name='req_return'),
+    path('simulation_analysis/<slug>/', SimulationView.as_view(), name='simulation'),
+    path('simulation_data/<slug>/', SimulationDataView.as_view(), name='simulation_data'),
+    path('jobs/<int:pk>/', views.SimulationJobStatusView.as_view(), name='job_status'),
+    path('prediction/<slug>/', PredictionView.as_view(), name='prediction'),
+    path('sweep/<slug>/', SweepView.as_view(), name='sweep'),
+    path('dashboard/<slug>/', DashboardView.as_view(), name='dashboard'),
     path('profile/<slug>/',views.FinancialProfileView.as_view(),name='profile')
 ]
\ No newline at end of file
@@ -1,10 +1,27 @@
-from django.shortcuts import render
+import asyncio
+import hashlib
+import json
+import os
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.decorators import method_decorator
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from finance.forms import FinancialInfoForm
-from finance.models import FinancialInfo
-from django.views.generic import CreateView, UpdateView, TemplateView,DetailView
+from finance.models import FinancialInfo, SimulationJob
+from django.views.generic import View, CreateView, UpdateView, TemplateView,DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.views import redirect_to_login
 from django.contrib import messages
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from finance import cache as finance_cache
+from finance.data import FinancialInfoMixin, get_financial_info
+from finance import executor, metrics, pipeline
 # Create your views here.
 #Run functions need LoginRequiredMixin and custom check that user has filled financial info
 
@@ -44,18 +61,22 @@ class FinanceUpdateView(LoginRequiredMixin,UpdateView):
         self.object=form.save(commit=False)
         self.object.user=self.request.user
         self.object.save()
+        #Only drop the analyses reading a changed field, the others stay valid
+        finance_cache.invalidate(self.object, pipeline.affected_stages(form.changed_data))
         messages.success(self.request, "Information Updated!")
         return super().form_valid(form)
 
 
-from finance import health_check
+#health_check pulls in numpy and scipy, it is imported on first use so workers serving other pages never load them
+from finance import jobs
 
-class ReqReturnView(LoginRequiredMixin, TemplateView):
+class ReqReturnView(LoginRequiredMixin, FinancialInfoMixin, TemplateView):
     template_name='finance/req_return.html'
     context_object_name='object'
+    analyses=('req_return',)
     def get_context_data(self, **kwargs):
         context=super().get_context_data(**kwargs)
-        q=FinancialInfo.objects.get(user__id=self.request.user.id)
+        q=self.get_financial_info()
         userIncome=q.income
         incomeGrowth=q.income_growth
         userSpending=q.spending
@@ -64,49 +85,355 @@ class ReqReturnView(LoginRequiredMixin, TemplateView):
         userCurrentAge=q.current_age
         userDeathAge=q.death_age
         userRetirementAge=q.retirement_age
-        diagnosis=health_check.reqReturnHealthCheck(userIncome, incomeGrowth, userSpending, inflation, userSavings, userCurrentAge, userDeathAge, userRetirementAge)
+        from finance import health_check
+        diagnosis=finance_cache.get_or_compute('req_return', q, finance_cache.REQ_RETURN_FIELDS,
+            lambda: health_check.reqReturnHealthCheck(userIncome, incomeGrowth, userSpending, inflation, userSavings, userCurrentAge, userDeathAge, userRetirementAge))
         context['diagnosis']=diagnosis
         return context
 
-class SimulationView(LoginRequiredMixin, TemplateView):
+def simulation_preview(request, q):
+    """
+    Context of the rough analytic preview of the median wealth path, rendered at once with a link to the full
+    Monte Carlo run, which alone gives the diagnosis
+    Output: Dictionary, None when previews are off or the full simulation was asked for
+    """
+    if not getattr(settings, 'FINANCE_SIM_PREVIEW', False) or request.GET.get('full'):
+        return None
+    from finance import preview
+    #Microseconds of arithmetic, cheaper than a cache lookup
+    return {'preview':{'series':preview.previewSeries(*jobs.simulation_arguments(q))}, 'full_url':request.path+'?full=1'}
+
+class SimulationView(LoginRequiredMixin, FinancialInfoMixin, TemplateView):
     template_name='finance/simulation.html'
     context_object_name='object'
+    analyses=('simulation',)
     def get_context_data(self, **kwargs):
         context=super().get_context_data(**kwargs)
-        q=FinancialInfo.objects.get(user__id=self.request.user.id)
-        userIncome=q.income
-        incomeGrowth=q.income_growth
-        userSpending=q.spending
-        inflation=q.inflation
-        userSavings=q.savings
-        investmentRisk=q.investment_risk
-        userCurrentAge=q.current_age
-        userDeathAge=q.death_age
-        userRetirementAge=q.retirement_age
-        diagnosis=health_check.simHealthCheck(userIncome, incomeGrowth, userSpending, inflation, userSavings, investmentRisk, userCurrentAge, userDeathAge, userRetirementAge)
+        preview=simulation_preview(self.request, self.get_financial_info())
+        if preview is not None:
+            context.update(preview)
+            return context
+        if getattr(settings, 'FINANCE_CHART_MODE', 'bokeh')=='json':
+            #The page only carries the data URL, the chart is drawn client side from the cacheable JSON series
+            context['data_url']=reverse('finance:simulation_data', kwargs={'slug':kwargs['slug']})
+            return context
+        q=self.get_financial_info()
+        if getattr(settings, 'FINANCE_ASYNC_SIMULATION', False):
+            #Return immediately, the page polls the job and fills in the result when it finishes
+            diagnosis=finance_cache.get('simulation', q, finance_cache.SIMULATION_FIELDS)
+            if diagnosis is None:
+                job=jobs.submit_simulation(q)
+                context['job_url']=reverse('finance:job_status', kwargs={'pk':job.pk})
+                return context
+        else:
+            #Cache the rendered Bokeh script/div along with the diagnosis so a refresh costs nothing
+            from finance import health_check
+            diagnosis=finance_cache.get_or_compute('simulation', q, finance_cache.SIMULATION_FIELDS,
+                lambda: health_check.simHealthCheck(*jobs.simulation_arguments(q), **jobs.simulation_options(q)))
         context['diagnosis'], context['script'], context['div']=diagnosis
         return context
 
+def simulation_data_etag(request, slug):
+    #The key hashes the simulation inputs and engine version, so it identifies the response content
+    q=get_financial_info(request, 'simulation')
+    if getattr(settings, 'FINANCE_ASYNC_SIMULATION', False) and finance_cache.get('simulation_data', q, finance_cache.SIMULATION_FIELDS) is None:
+        #Still to be computed in the background, the pending response must not be revalidated later
+        return None
+    return finance_cache.cache_key('simulation_data', q, finance_cache.SIMULATION_FIELDS)
+
+def simulation_data(q):
+    """
+    Output: Cached or freshly computed (diagnosis, series) of the simulation data endpoint
+    """
+    from finance import health_check
+    #Seeded from the inputs so a recomputed entry matches the ETag clients already hold
+    return finance_cache.get_or_compute('simulation_data', q, finance_cache.SIMULATION_FIELDS,
+        lambda: health_check.simHealthCheckData(*jobs.simulation_arguments(q), **jobs.simulation_options(q)))
 
-from finance.prediction import encoding_order,predictor_description,make_prediction
-class PredictionView(LoginRequiredMixin, TemplateView):
+def simulation_data_pending(q):
+    """
+    Queues the simulation data of q in the background unless it is cached
+    Output: 202 response pointing at the job to poll, None when the result is cached
+    """
+    if finance_cache.get('simulation_data', q, finance_cache.SIMULATION_FIELDS) is not None:
+        return None
+    job=jobs.submit_simulation(q, 'simulation_data')
+    return JsonResponse({'status':'pending', 'job_url':reverse('finance:job_status', kwargs={'pk':job.pk})}, status=202)
+
+class SimulationDataView(LoginRequiredMixin, View):
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(condition(etag_func=simulation_data_etag))
+    def get(self, request, slug):
+        q=get_financial_info(request, 'simulation')
+        if getattr(settings, 'FINANCE_ASYNC_SIMULATION', False):
+            #Keep the Monte Carlo off the request thread, the chart polls the job
+            pending=simulation_data_pending(q)
+            if pending is not None:
+                return pending
+        diagnosis, series=simulation_data(q)
+        return JsonResponse({'diagnosis':diagnosis, 'series':series})
+
+def parse_sweep_values(query, name, default):
+    """
+    Reads one swept field from the query string, either 'start:stop:step' (stop included) or 'a,b,c'
+    Input:
+        query (QueryDict): Request query parameters
+        name (String): Parameter name
+        default (Int): Value used when the parameter is missing, the user's current one
+    Output: List of integers, raises ValueError on malformed input
+    """
+    value=query.get(name)
+    if not value:
+        return [default]
+    limit=getattr(settings, 'FINANCE_SWEEP_MAX_VALUES', 50)
+    if ':' in value:
+        start, stop, step=(int(v) for v in value.split(':'))
+        if step<=0:
+            raise ValueError('%s step must be positive' % name)
+        #Counted before the range is built, len() of a range beyond sys.maxsize raises OverflowError
+        count=max((stop-start)//step+1, 0)
+        values=range(start, stop+1, step) if 0<count<=limit else []
+    else:
+        values=[int(v) for v in value.split(',')]
+        count=len(values)
+    if not 0<count<=limit:
+        raise ValueError('%s must list between 1 and %d values' % (name, limit))
+    return list(values)
+
+def parse_sweep(query, q):
+    """
+    Reads and checks the swept values of a sweep request
+    Input:
+        query (QueryDict): Request query parameters
+        q (FinancialInfo): User financial information row, its values are the defaults
+    Output: Tuple of (cache kind, retirement ages, spendings, risks), raises ValueError on invalid input
+    """
+    retirement_ages=parse_sweep_values(query, 'retirement_age', q.retirement_age)
+    spendings=parse_sweep_values(query, 'spending', q.spending)
+    risks=parse_sweep_values(query, 'investment_risk', q.investment_risk)
+    if any(age<q.current_age or age>q.death_age for age in retirement_ages):
+        raise ValueError('retirement_age must lie between the current age and the death age')
+    if any(spending<0 for spending in spendings) or any(risk<1 or risk>9 for risk in risks):
+        raise ValueError('spending must be positive and investment_risk between 1 and 9')
+    cells=len(retirement_ages)*len(spendings)*len(risks)
+    if cells>getattr(settings, 'FINANCE_SWEEP_MAX_CELLS', 500):
+        raise ValueError('The sweep has %d cells, the limit is %d' % (cells, settings.FINANCE_SWEEP_MAX_CELLS))
+    #Each grid is its own cache entry, hashed to keep the key short and free of spaces
+    kind='sweep:%s' % hashlib.sha1(repr((retirement_ages, spendings, risks)).encode()).hexdigest()[:16]
+    return (kind, retirement_ages, spendings, risks)
+
+def compute_sweep(q, kind, retirement_ages, spendings, risks):
+    from finance import health_check, scenarios, sweep
+    trials=getattr(settings, 'FINANCE_SWEEP_TRIALS', 2000)
+    bank_path=getattr(settings, 'FINANCE_SCENARIO_BANK', None)
+    bank=scenarios.openBank(bank_path) if bank_path and os.path.exists(bank_path) else None
+    seed=int(finance_cache.input_digest(kind, q, finance_cache.SIMULATION_FIELDS)[:8], 16)
+    shocks=sweep.sweepShocks(q.death_age-q.current_age, trials, seed=seed, bank=bank)
+    req_returns, ruin=sweep.sweepGrid(q.income, q.income_growth, q.inflation, q.savings, q.current_age, q.death_age,
+        retirement_ages, spendings, [health_check.riskReturnProfile(risk) for risk in risks], shocks)
+    return {'retirement_age':retirement_ages, 'spending':spendings, 'investment_risk':risks, 'trials':trials,
+            #required_return[age][spending], ruin_probability[risk][age][spending] in percent
+            'required_return':req_returns.round(6).tolist(), 'ruin_probability':ruin.round(2).tolist()}
+
+def sweep_data(q, kind, retirement_ages, spendings, risks):
+    """
+    Output: Cached or freshly computed heatmap grids of a parsed sweep, see parse_sweep
+    """
+    return finance_cache.get_or_compute(kind, q, finance_cache.SIMULATION_FIELDS, lambda: compute_sweep(q, kind, retirement_ages, spendings, risks))
+
+class SweepView(LoginRequiredMixin, FinancialInfoMixin, View):
+    """
+    What-if sweep over retirement_age, spending and investment_risk ranges, returned as heatmap grids
+    """
+    analyses=('simulation',)
+    def get(self, request, slug):
+        q=self.get_financial_info()
+        try:
+            grid=parse_sweep(request.GET, q)
+        except ValueError as e:
+            return JsonResponse({'error':str(e)}, status=400)
+        return JsonResponse(sweep_data(q, *grid))
+
+class SimulationJobStatusView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        job=get_object_or_404(SimulationJob, pk=pk, financial_info__user__id=request.user.id)
+        data={'status':job.status}
+        if job.status==SimulationJob.DONE and job.series:
+            data.update(diagnosis=job.diagnosis, series=json.loads(job.series))
+        elif job.status==SimulationJob.DONE:
+            data.update(diagnosis=job.diagnosis, script=job.script, div=job.div)
+        elif job.status==SimulationJob.FAILED:
+            data['error']='The simulation could not be completed, please try again.'
+        return JsonResponse(data)
+
+
+from finance.prediction import predictor_description
+class PredictionView(LoginRequiredMixin, FinancialInfoMixin, TemplateView):
     template_name='finance/prediction.html'
     context_object_name='object'
+    analyses=('prediction',)
     def get_context_data(self, **kwargs):
         context=super().get_context_data(**kwargs)
-        q=FinancialInfo.objects.get(user__id=self.request.user.id)
+        q=self.get_financial_info()
         
         if q.FWB1_3:
-            #Make Predictions
-            selection_dict={p:getattr(q,p) for p in encoding_order}
-            results=make_prediction(selection_dict, encoding_order)
-            #append results to context
-            context['diagnosis']=results
+            #Make Predictions, looked up in the precomputed table
+            from finance import dashboard
+            context.update(dashboard.prediction_section(q))
         return context
 
+#Async variants of the analysis views, served under ASGI. The row is read through sync_to_async and the
+#numerical work runs on the bounded executor, so a waiting request holds no thread
+def busy_response():
+    response=HttpResponse('The analysis service is busy, please try again shortly.', status=503, content_type='text/plain')
+    response['Retry-After']=str(getattr(settings, 'FINANCE_RETRY_AFTER', 5))
+    return response
+
+class AsyncAnalysisView(FinancialInfoMixin, View):
+    template_name=None
+    #Name of the finance.dashboard section whose context the page renders, run on an executor thread
+    section=None
+
+    async def get_analysis_context(self, q, slug):
+        from finance import dashboard
+        return await executor.get_executor().run(dashboard.section_functions[self.section], q)
+
+    async def get(self, request, slug):
+        #The session and user lookups hit the database, resolve them off the event loop
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        q=await sync_to_async(self.get_financial_info)()
+        try:
+            return await self.respond(request, q, slug)
+        except executor.Saturated:
+            return busy_response()
+
+    async def respond(self, request, q, slug):
+        context=await self.get_analysis_context(q, slug)
+        return render(request, self.template_name, context)
+
+class AsyncReqReturnView(AsyncAnalysisView):
+    template_name='finance/req_return.html'
+    analyses=('req_return',)
+    section='req_return'
+
+class AsyncSimulationView(AsyncAnalysisView):
+    template_name='finance/simulation.html'
+    analyses=('simulation',)
+    section='simulation'
+
+    async def get_analysis_context(self, q, slug):
+        preview=simulation_preview(self.request, q)
+        if preview is not None:
+            return preview
+        if getattr(settings, 'FINANCE_CHART_MODE', 'bokeh')=='json':
+            return {'data_url':reverse('finance:simulation_data', kwargs={'slug':slug})}
+        if getattr(settings, 'FINANCE_ASYNC_SIMULATION', False):
+            diagnosis=finance_cache.get('simulation', q, finance_cache.SIMULATION_FIELDS)
+            if diagnosis is None:
+                job=await sync_to_async(jobs.submit_simulation)(q)
+                return {'job_url':reverse('finance:job_status', kwargs={'pk':job.pk})}
+            return dict(zip(['diagnosis', 'script', 'div'], diagnosis))
+        return await super().get_analysis_context(q, slug)
+
+class AsyncPredictionView(AsyncAnalysisView):
+    template_name='finance/prediction.html'
+    analyses=('prediction',)
+    section='prediction'
+
+class AsyncSimulationDataView(AsyncAnalysisView):
+    analyses=('simulation',)
+    async def respond(self, request, q, slug):
+        etag=await sync_to_async(simulation_data_etag)(request, slug)
+        if etag is not None and quote_etag(etag) in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response=HttpResponseNotModified()
+        else:
+            response=None
+            if getattr(settings, 'FINANCE_ASYNC_SIMULATION', False):
+                response=await sync_to_async(simulation_data_pending)(q)
+            if response is None:
+                diagnosis, series=await executor.get_executor().run(simulation_data, q)
+                response=JsonResponse({'diagnosis':diagnosis, 'series':series})
+        if etag is not None:
+            response['ETag']=quote_etag(etag)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+class AsyncSweepView(AsyncAnalysisView):
+    analyses=('simulation',)
+    async def respond(self, request, q, slug):
+        try:
+            grid=parse_sweep(request.GET, q)
+        except ValueError as e:
+            return JsonResponse({'error':str(e)}, status=400)
+        return JsonResponse(await executor.get_executor().run(sweep_data, q, *grid))
+
+class AsyncDashboardView(AsyncAnalysisView):
+    analyses=('req_return', 'simulation', 'prediction')
+    async def respond(self, request, q, slug):
+        from finance import dashboard
+        pool=executor.get_executor()
+        #Claim the executor before anything is streamed, so a busy worker answers 503 rather than half a page
+        await pool.run(dashboard.build_shared_inputs, q)
+        head, tail=await sync_to_async(dashboard_frame)(request)
+        async def stream():
+            #Started by the loop consuming the stream
+            tasks=[asyncio.ensure_future(self.section(pool, name, q)) for name, _ in dashboard.SECTIONS]
+            yield head
+            for task in asyncio.as_completed(tasks):
+                name, heading, context=await task
+                yield render_to_string('finance/dashboard_section.html', dict(context, name=name, heading=heading))
+            yield tail
+        response=StreamingHttpResponse(stream())
+        response['X-Accel-Buffering']='no'
+        return response
+
+    async def section(self, pool, name, q):
+        from finance import dashboard
+        try:
+            return await pool.run(dashboard.run_section, name, q)
+        except executor.Saturated:
+            return name, dict(dashboard.SECTIONS)[name], {'error':'The analysis service is busy, please try again shortly.'}
+
+#Stands in for the analysis sections when the dashboard page is split around them
+SECTIONS_MARKER='<!--dashboard-sections-->'
+
+def dashboard_frame(request):
+    """
+    Output: Tuple of the dashboard page head and tail, rendered around the sections
+    """
+    return tuple(render_to_string('finance/dashboard.html', {'sections':SECTIONS_MARKER}, request=request).split(SECTIONS_MARKER))
+
+class DashboardView(LoginRequiredMixin, FinancialInfoMixin, View):
+    analyses=('req_return', 'simulation', 'prediction')
+    def get(self, request, slug):
+        from finance import dashboard
+        q=self.get_financial_info()
+        head, tail=dashboard_frame(request)
+        def stream():
+            #Flush the page head first, then each analysis as soon as its thread finishes
+            yield head
+            for name, heading, context in dashboard.run_sections(q):
+                yield render_to_string('finance/dashboard_section.html', dict(context, name=name, heading=heading))
+            yield tail
+        response=StreamingHttpResponse(stream())
+        #Stop proxies from buffering the stream into one late response
+        response['X-Accel-Buffering']='no'
+        return response
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of this process's finance metrics, 404 while FINANCE_METRICS is off
+    """
+    if not metrics.enabled:
+        raise Http404('Metrics are disabled')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 class FinancialProfileView(LoginRequiredMixin,DetailView):
     context_object_name='financial_info'
     model=FinancialInfo
+    #The template shows the user's name, fetch it in the same query
+    queryset=FinancialInfo.objects.select_related('user')
     template_name='finance/profile.html'
     def get_context_data(self, **kwargs):
         